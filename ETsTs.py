@@ -1,4 +1,4 @@
-from petlib.ec import EcGroup, Bn
+from petlib.ec import EcGroup, EcPt, Bn
 import time
 import random
 import multiprocessing as mp
@@ -7,10 +7,21 @@ import os
 from os import path
 import shutil
 import binascii
-import trie
+import mmap
+import struct
+import tempfile
+import itertools
+import array
+import hashlib
 from collections import Counter
 import sys
 import ast
+import json
+import resource
+import contextlib
+import bisect
+import heapq
+import queue
 
 CURVENUMBER = 714 #SECG curve over a 256 bit primefield ("secp256k1")
 #CURVENUMBER = 716 # NIST/SECG curve over a 521 bit prime field ("secp521r1")
@@ -37,9 +48,159 @@ def printProgressBar (iteration, total, prefix = '', suffix = '', decimals = 1,
     if iteration == total:
         print()
 
+class Metrics:
+    """
+    Counters and phase timers (points generated, probes, bytes scanned, giant steps, ...)
+    ...
+    Attributes
+    ----------
+    counters : dict
+        Count of each event
+    timers : dict
+        Seconds spent in each phase
+    start : float
+        Time of creation or last reset
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clears all counters and timers"""
+        self.counters = {}
+        self.timers = {}
+        self.start = time.time()
+
+    def inc(self, name, n=1):
+        """Adds n to counter name"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def addtime(self, name, seconds):
+        """Adds seconds to timer name"""
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the enclosed block under timer name"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.addtime(name, time.time() - start)
+
+    def snapshot(self):
+        """Returns counters, timers and per second rates since start"""
+        elapsed = max(time.time() - self.start, 1e-9)
+        return {'uptime':elapsed, 'counters':dict(self.counters), 'seconds':dict(self.timers),
+                'persec':{name: count/elapsed for name, count in self.counters.items()}}
+
+    def dump(self, filename=None, fmt='log'):
+        """
+        Writes metrics to filename and returns them as text.
+        fmt 'log' appends one JSON line (default file logfile.log),
+        fmt 'prom' overwrites filename with Prometheus text format.
+        """
+        snap = self.snapshot()
+        if fmt == 'prom':
+            lines = ['dlog_uptime_seconds %f' % snap['uptime']]
+            for name, count in sorted(snap['counters'].items()):
+                lines.append('# TYPE dlog_%s_total counter' % name)
+                lines.append('dlog_%s_total %d' % (name, count))
+            lines.append('# TYPE dlog_phase_seconds counter')
+            for name, seconds in sorted(snap['seconds'].items()):
+                lines.append('dlog_phase_seconds{phase="%s"} %f' % (name, seconds))
+            text = '\n'.join(lines) + '\n'
+            if filename != None:
+                with open(filename, 'w') as f:
+                    f.write(text)
+        else:
+            text = time.strftime('%Y-%m-%d %H:%M:%S') + ' ' + json.dumps(snap) + '\n'
+            with open("logfile.log" if filename == None else filename, 'a') as f:
+                f.write(text)
+        return text
+
+METRICS = Metrics()
+
+class Progress:
+    """
+    Progress bar redrawn at most once per interval, cheap to update on every iteration
+    ...
+    Attributes
+    ----------
+    total : int
+        Last iteration
+    counter, phase : string
+        Metrics counter of iterations and timer of elapsed time (None to skip)
+    """
+    def __init__(self, total, start=0, counter=None, phase=None, interval=1.0, prefix='Progress:', metrics=None):
+
+        """
+        Parameters
+        ----------
+        total : int
+            Last iteration
+        start : int
+            First iteration (when resuming)
+        counter, phase : string
+            Metrics counter of iterations and timer of elapsed time (None to skip)
+        interval : float
+            Seconds between redraws
+        prefix : string
+            Shown before the bar
+        metrics : Metrics
+            Where counter and phase are recorded (METRICS if None)
+        """
+        self.total = total
+        self.counter = counter
+        self.phase = phase
+        self.interval = interval
+        self.prefix = prefix
+        self.metrics = METRICS if metrics == None else metrics
+        self.first = self.done = self.nextcheck = start
+        self.start = self.lastdraw = time.time()
+
+    def update(self, iteration):
+        """Records progress up to iteration, redrawing if interval has passed"""
+        if (iteration < self.nextcheck and iteration < self.total) or self.done >= self.total:
+            return
+        now = time.time()
+        rate = (iteration - self.first) / max(now - self.start, 1e-9)
+        #look at the clock again after about 1/100 of an interval worth of iterations
+        self.nextcheck = iteration + max(1, int(rate*self.interval/100))
+        if now - self.lastdraw < self.interval and iteration < self.total:
+            return
+        self.lastdraw = now
+        if self.counter != None:
+            self.metrics.inc(self.counter, iteration - self.done)
+        self.done = iteration
+        if iteration >= self.total and self.phase != None:
+            self.metrics.addtime(self.phase, now - self.start)
+        printProgressBar(min(iteration, self.total), self.total, prefix = self.prefix,
+                         suffix = '%d/sec' % rate, length = 50)
+
+_GROUPS = {} #EcGroup and generator per curve, created on first use in each process
+
+def curveGroup(curve=CURVENUMBER):
+    """
+    Returns the (cached) group and generator of a curve
+    Parameters
+    ----------
+    curve : int
+        Curve identifier as in petlib
+    Returns
+    -------
+    tuple
+        (EcGroup, EcPt) group and its generator
+    """
+    if curve not in _GROUPS:
+        group = EcGroup(curve)
+        _GROUPS[curve] = (group, group.generator())
+    return _GROUPS[curve]
+
 class PublicParams:
     """
     Represents system's public parameters
+    The group is only created when first used, so importing the module
+    (or starting a worker process) does not build it.
     ...
     Attributes
     ----------
@@ -48,16 +209,32 @@ class PublicParams:
     g : EcPt
         Generator g
     """
-    group = EcGroup(CURVENUMBER)
-    def __init__(self, g = group.generator()):
+    def __init__(self, g = None, curve = CURVENUMBER):
 
         """
         Parameters
         ----------
         g : EcPt
-            Generator g
+            Generator g (the curve's generator if None)
+        curve : int
+            Curve identifier as in petlib
         """
-        self.g = g
+        self.curve = curve
+        self._g = g
+
+    @property
+    def group(self):
+        return curveGroup(self.curve)[0]
+
+    @property
+    def g(self):
+        if self._g is None: #EcPt cannot be compared to None
+            self._g = curveGroup(self.curve)[1]
+        return self._g
+
+    @g.setter
+    def g(self, g):
+        self._g = g
 
 PP = PublicParams()
 
@@ -92,47 +269,190 @@ def lookup2File(rng):
     """
     with open(str(CURVENUMBER)+'-'+str(rng)+'bits.txt', 'w') as filehandle:
         temp = PP.g
+        progress = Progress(2**rng, 1, counter = 'points', phase = 'generate')
         for i in range(1, 2**rng):
             filehandle.write('%s\n' % str(temp))
             temp = temp + PP.g
-            printProgressBar(i + 1, 2**rng, prefix = 'Progress:', suffix = 'Complete', length = 50)
+            progress.update(i + 1)
     return None
 
-def readLookFromFile(rng):
+class LookupDict(dict):
+    """
+    In-memory lookup table as a hash map from element keys to their index in the table
+    Truncated keys of different elements may collide, in which case the key maps to
+    a tuple of all their indices, and keys of elements not in the table may match,
+    so hits have to be checked (see isLog()).
+    ...
+    Attributes
+    ----------
+    keywidth : int
+        Keys are the first keywidth bytes after the compression prefix, as integers.
+        If None, keys are the whole encoding in bytes.
+    entries : int
+        Number of elements added (len() of the table)
+    """
+    def __init__(self, keywidth=None):
+
+        """
+        Parameters
+        ----------
+        keywidth : int
+            Truncated key size in bytes (whole encoding if None)
+        """
+        super().__init__()
+        self.keywidth = keywidth
+        self.entries = 0
+
+    def __len__(self):
+        return self.entries
+
+    def add(self, elem, idx):
+        """Adds hex element elem at index idx"""
+        key = self.key(elem)
+        old = self.setdefault(key, idx)
+        if old != idx:
+            self[key] = (old if isinstance(old, tuple) else (old,)) + (idx,)
+        self.entries += 1
+
+    def indices(self, elem):
+        """Returns indices of the elements whose key matches hex element elem"""
+        idx = self.get(self.key(elem))
+        if idx == None:
+            return ()
+        return idx if isinstance(idx, tuple) else (idx,)
+
+    def key(self, elem):
+        """Returns key of hex element elem"""
+        if self.keywidth == None:
+            return bytes.fromhex(elem)
+        return int(elem[2:2+2*self.keywidth],16)
+
+def _readLookup(filename,asdict,keywidth):
+    """Loads lookup table from file as a list, or as a LookupDict if asdict is set"""
+    with open(filename, 'r') as filehandle:
+        if not asdict:
+            return [line[:-1] for line in filehandle]
+        readDict = LookupDict(keywidth)
+        for idx, line in enumerate(filehandle):
+            readDict.add(line[:-1], idx)
+        return readDict
+
+def readLookFromFile(rng,asdict=False,keywidth=None):
     """Loads lookup table from file formatted as XXbits.txt
     Parameters
     ----------
     rng : int
         Range of table
+    asdict : bool
+        Return a LookupDict instead of a list
+    keywidth : int
+        Key size in bytes of the LookupDict (see LookupDict)
     Returns
     -------
     readList: list
     """
-    readList = []
-    with open(str(CURVENUMBER)+'-'+str(rng)+'bits.txt', 'r') as filehandle:
-        filecontents = filehandle.readlines()
-        for line in filecontents:
-            current_place = line[:-1]
-            readList.append(current_place)
-    return readList
+    return _readLookup(str(CURVENUMBER)+'-'+str(rng)+'bits.txt',asdict,keywidth)
 
-def readLookFromFileB(filename):
+def readLookFromFileB(filename,asdict=False,keywidth=None):
     """Loads lookup table from file
     Parameters
     ----------
     filename : string
         Name of file
+    asdict : bool
+        Return a LookupDict instead of a list
+    keywidth : int
+        Key size in bytes of the LookupDict (see LookupDict)
+    Example: readLookFromFileB("714-1to65536.txt",True,4)
     Returns
     -------
     readList: list
     """    
-    readList = []
+    return _readLookup(filename,asdict,keywidth)
+
+def iterLookFromFile(filename,chunksize=2**16,mode='str'):
+    """Reads lookup table from file in chunks, without loading the whole file
+    Parameters
+    ----------
+    filename : string
+        Name of file (one hex element per line)
+    chunksize : int
+        Number of elements per chunk
+    mode : string
+        'str' for hex strings, 'bytes' for decoded bytes (even length lines only),
+        'int' for integers
+    Example: for chunk in iterLookFromFile("714-1to65536.txt",mode='bytes'): ...
+    Yields
+    -------
+    list
+        Next chunk of elements
+    """
     with open(filename, 'r') as filehandle:
-        filecontents = filehandle.readlines()
-        for line in filecontents:
-            current_place = line[:-1]
-            readList.append(current_place)
-    return readList
+        while True:
+            lines = list(itertools.islice(filehandle, chunksize))
+            if not lines:
+                return
+            if mode == 'bytes':
+                yield [bytes.fromhex(line[:-1]) for line in lines]
+            elif mode == 'int':
+                yield [int(line[:-1],16) for line in lines]
+            else:
+                yield [line[:-1] for line in lines]
+
+def iterBinTable(filename,truncvalue=None,chunkentries=2**20):
+    """Reads truncated binary table (raw or with header) in chunks with numpy.fromfile
+    Parameters
+    ----------
+    filename : string
+        Truncated binary file
+    truncvalue : int
+        Truncation parameter (in hexes) of raw files
+    chunkentries : int
+        Number of entries per chunk
+    Yields
+    -------
+    numpy.ndarray
+        uint8 array of shape (entries, width) for the next chunk
+    """
+    import numpy as np
+    with open(str(filename), 'rb') as filehandle:
+        header = readTableHeader(filehandle)
+        width = header['width'] if header != None else (truncvalue+1)//2
+        while True:
+            chunk = np.fromfile(filehandle, dtype=np.uint8, count=chunkentries*width)
+            if len(chunk) < width:
+                return
+            yield chunk[:len(chunk) - len(chunk) % width].reshape(-1, width)
+
+def readMatrixFromFile(filename,chunksize=2**16):
+    """Loads lookup table from file as a hex digit matrix (see tableMatrix()), chunk by chunk,
+       so the file is never held as a list of strings
+    Parameters
+    ----------
+    filename : string
+        Name of file
+    chunksize : int
+        Number of elements converted at a time
+    Returns
+    -------
+    numpy.ndarray
+        uint8 matrix of hex digits
+    """
+    import numpy as np
+    with open(filename, 'r') as filehandle:
+        linelen = len(filehandle.readline())
+    if linelen == 0:
+        return np.empty((0, 0), np.uint8)
+    rows = os.path.getsize(filename)//linelen
+    matrix = np.empty((rows, linelen-1), np.uint8)
+    with open(filename, 'rb') as filehandle:
+        for row in range(0, rows, chunksize):
+            n = min(chunksize, rows-row)
+            block = np.frombuffer(filehandle.read(n*linelen), dtype=np.uint8).reshape(n, linelen)
+            part = matrix[row:row+n]
+            np.subtract(block[:, :-1], ord('0'), out=part) #as tableMatrix(), dropping newlines
+            part[part > 9] -= ord('a') - ord('0') - 10
+    return matrix
 
 def lookup2FileRes(rng):
     """Generates a lookup table with range 2^rng, resuming if previous exists.
@@ -156,10 +476,11 @@ def lookup2FileRes(rng):
         startIdx = 2**r
     with open(str(CURVENUMBER)+'-'+str(rng)+'bits.txt', 'a') as filehandle:
         temp = startIdx*PP.g
+        progress = Progress(2**rng, startIdx, counter = 'points', phase = 'generate')
         for i in range(startIdx, 2**rng):
             filehandle.write('%s\n' % str(temp))
             temp = temp + PP.g
-            printProgressBar(i + 1, 2**rng, prefix = 'Progress:', suffix = 'Complete', length = 50)
+            progress.update(i + 1)
     return None
 
 def lookup2FileB(torng,fromrng=0):
@@ -176,10 +497,11 @@ def lookup2FileB(torng,fromrng=0):
     startIdx = 2**fromrng
     with open(str(CURVENUMBER)+'-'+str(fromrng)+'to'+str(torng)+'bits.txt', 'a') as filehandle:
         temp = startIdx*PP.g
+        progress = Progress(2**torng, startIdx, counter = 'points', phase = 'generate')
         for i in range(startIdx, 2**torng):
             filehandle.write('%s\n' % str(temp))
             temp = temp + PP.g
-            printProgressBar(i + 1, 2**torng, prefix = 'Progress:', suffix = 'Complete', length = 50)
+            progress.update(i + 1)
     return None
 
 def lookup2FileC(torng,fromrng=1):
@@ -195,10 +517,11 @@ def lookup2FileC(torng,fromrng=1):
     """
     with open(str(CURVENUMBER)+'-'+str(fromrng)+'to'+str(torng)+'.txt', 'a') as filehandle:
         temp = fromrng*PP.g
+        progress = Progress(torng, fromrng, counter = 'points', phase = 'generate')
         for i in range(fromrng, torng):
             filehandle.write('%s\n' % str(temp))
             temp = temp + PP.g
-            printProgressBar(i + 1, torng, prefix = 'Progress:', suffix = 'Complete', length = 50)
+            progress.update(i + 1)
     return None
 
 def concatFiles(fromrng,midrng,torng):
@@ -241,6 +564,213 @@ def concatFilesC(fromrng,midrng,torng):
                 for line in infile:
                     outfile.write(line)
 
+def _jacobianAdd(P,Q,p,a):
+    """Adds affine point Q=(x,y) to Jacobian point P=(X,Y,Z) over GF(p)"""
+    X1, Y1, Z1 = P
+    x2, y2 = Q
+    if Z1 == 0:
+        return (x2, y2, 1)
+    Z1Z1 = Z1*Z1 % p
+    H = (x2*Z1Z1 - X1) % p
+    r = (y2*Z1Z1*Z1 - Y1) % p
+    if H == 0:
+        if r != 0:
+            return (1, 1, 0) #P = -Q
+        #P = Q, double it
+        if Y1 == 0:
+            return (1, 1, 0)
+        YY = Y1*Y1 % p
+        S = 4*X1*YY % p
+        M = (3*X1*X1 + a*Z1Z1*Z1Z1) % p
+        X3 = (M*M - 2*S) % p
+        return (X3, (M*(S - X3) - 8*YY*YY) % p, 2*Y1*Z1 % p)
+    HH = H*H % p
+    HHH = H*HH % p
+    V = X1*HH % p
+    X3 = (r*r - HHH - 2*V) % p
+    return (X3, (r*(V - X3) - Y1*HHH) % p, Z1*H % p)
+
+def _batchInvert(values,p):
+    """Inverts all non-zero values mod p with a single inversion (Montgomery's trick)"""
+    prefix = []
+    acc = 1
+    for v in values:
+        prefix.append(acc)
+        if v:
+            acc = acc*v % p
+    inv = pow(acc, -1, p)
+    result = [0]*len(values)
+    for k in range(len(values)-1, -1, -1):
+        v = values[k]
+        if v:
+            result[k] = inv*prefix[k] % p
+            inv = inv*v % p
+    return result
+
+def encodedSteps(startpt,steppt,count,blocksize=4096):
+    """Yields compressed encodings (as str(EcPt)) of startpt + k*steppt for k in 0..count-1.
+       Points are accumulated in Jacobian coordinates and normalized in blocks
+       with one field inversion per block.
+    Parameters
+    ----------
+    startpt, steppt : EcPt
+        First point and step
+    count : int
+        Number of points
+    blocksize : int
+        Points normalized together
+    Example: list(encodedSteps(PP.g,PP.g,10))
+    """
+    params = startpt.group.parameters()
+    p, a = int(params['p']), int(params['a'])
+    hexlen = 2*((p.bit_length()+7)//8)
+    Q = tuple(int(c) for c in steppt.get_affine())
+    if startpt.is_infinite():
+        P = (1, 1, 0)
+    else:
+        P = tuple(int(c) for c in startpt.get_affine()) + (1,)
+    done = 0
+    while done < count:
+        block = []
+        for _ in range(min(blocksize, count-done)):
+            block.append(P)
+            P = _jacobianAdd(P, Q, p, a)
+        zinvs = _batchInvert([Z for _, _, Z in block], p)
+        out = []
+        for (X, Y, Z), zinv in zip(block, zinvs):
+            if Z == 0:
+                out.append('00') #point at infinity
+                continue
+            zinv2 = zinv*zinv % p
+            y = Y*zinv2*zinv % p
+            out.append('%02x%0*x' % (2 + (y & 1), hexlen, X*zinv2 % p))
+        done += len(block)
+        yield from out
+
+def lookup2FileBatch(torng,fromrng=1,blocksize=4096):
+    """Generates a lookup table from range fromrng to torng, normalizing points in batches
+       (see encodedSteps()). Output is identical to lookup2FileC().
+       Saves it to .txt file
+    Parameters
+    ----------
+    fromrng, torng : int
+        Range of table
+    blocksize : int
+        Points normalized and written together
+    Returns
+    -------
+    None
+    """
+    start = time.time()
+    with open(str(CURVENUMBER)+'-'+str(fromrng)+'to'+str(torng)+'.txt', 'a') as filehandle:
+        block = []
+        progress = Progress(torng-fromrng, counter = 'points', phase = 'generate')
+        for i, elem in enumerate(encodedSteps(fromrng*PP.g, PP.g, torng-fromrng, blocksize)):
+            block.append(elem)
+            if len(block) == blocksize:
+                filehandle.write('\n'.join(block) + '\n')
+                block = []
+                progress.update(i + 1)
+        if block:
+            filehandle.write('\n'.join(block) + '\n')
+    progress.update(torng-fromrng)
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return None
+
+def lookup2FileBin(torng,fromrng=1,truncvalue=None,truncoffset=2,rng=None,blocksize=4096):
+    """Generates a lookup table from range fromrng to torng directly in binary table format
+       (header from writeTableHeader() followed by fixed width entries).
+       Saves it to .tbl file
+    Parameters
+    ----------
+    fromrng, torng : int
+        Range of table
+    truncvalue : int
+        Truncation parameter (in hexes). Full encodings are stored if None.
+    truncoffset : int
+        First hex kept when truncating (2 as in truncNomemleft())
+    rng : int
+        Range of the whole table this file is part of (torng-fromrng if None)
+    Example: lookup2FileBin(2**28+1,1,16,rng=2**32)
+    Returns
+    -------
+    None
+    """
+    if truncvalue == None:
+        truncvalue, truncoffset = len(str(PP.g)), 0
+    if rng == None:
+        rng = torng-fromrng
+    start = time.time()
+    with open(str(CURVENUMBER)+'-'+str(fromrng)+'to'+str(torng)+'.tbl', 'wb') as filehandle:
+        writeTableHeader(filehandle,fromrng,torng-fromrng,truncvalue,truncoffset,rng)
+        block = []
+        progress = Progress(torng-fromrng, counter = 'points', phase = 'generate')
+        for i, elem in enumerate(encodedSteps(fromrng*PP.g, PP.g, torng-fromrng, blocksize)):
+            block.append(truncKey(elem,truncvalue,truncoffset))
+            if len(block) == blocksize:
+                filehandle.write(b''.join(block))
+                block = []
+                progress.update(i + 1)
+        filehandle.write(b''.join(block))
+        progress.update(torng-fromrng)
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return None
+
+def _lookupChunk(args):
+    """Writes values fromidx to toidx-1 to chunkname (worker of lookup2FileParallel())"""
+    fromidx, toidx, chunkname = args
+    if path.exists(chunkname):
+        return chunkname #already completed by a previous run
+    with open(chunkname + ".tmp", 'w') as filehandle:
+        block = []
+        for elem in encodedSteps(fromidx*PP.g, PP.g, toidx-fromidx):
+            block.append(elem)
+            if len(block) == 4096:
+                filehandle.write('\n'.join(block) + '\n')
+                block = []
+        if block:
+            filehandle.write('\n'.join(block) + '\n')
+    os.rename(chunkname + ".tmp", chunkname)
+    return chunkname
+
+def lookup2FileParallel(torng,fromrng=1,cores=mp.cpu_count(),chunks=None):
+    """Generates a lookup table from range fromrng to torng using multiple cores.
+       Each chunk of the range is written to its own file by a worker starting at start*PP.g,
+       then chunks are stitched in order. Completed chunks (named after the range they
+       cover) are kept if interrupted, so running again resumes. Output is identical to lookup2FileC().
+       Saves it to .txt file
+    Parameters
+    ----------
+    fromrng, torng : int
+        Range of table
+    cores : int
+        Number of cores to be used
+    chunks : int
+        Number of chunks the range is split into (4 per core if None)
+    Example: lookup2FileParallel(2**20)
+    Returns
+    -------
+    None
+    """
+    if chunks == None:
+        chunks = 4*cores
+    outfilename = str(CURVENUMBER)+'-'+str(fromrng)+'to'+str(torng)+'.txt'
+    bounds = [fromrng + (torng-fromrng)*k//chunks for k in range(chunks+1)]
+    jobs = [(bounds[k], bounds[k+1], outfilename+".chunk"+str(bounds[k])+"-"+str(bounds[k+1])) for k in range(chunks) if bounds[k] < bounds[k+1]]
+    start = time.time()
+    progress = Progress(torng-fromrng, counter = 'points', phase = 'generate')
+    with mp.Pool(cores) as pool:
+        for k, _ in enumerate(pool.imap(_lookupChunk, jobs)):
+            progress.update(jobs[k][1]-fromrng)
+    with open(outfilename, 'w') as outfile:
+        for _, _, chunkname in jobs:
+            with open(chunkname) as infile:
+                shutil.copyfileobj(infile, outfile, 2**24)
+    for _, _, chunkname in jobs:
+        os.remove(chunkname)
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return None
+
 def truncate(lookupRaw):
     """Truncates lookuptable iteratively
     Parameters
@@ -335,8 +865,98 @@ def truncHeur(lookupRaw,target,quit=None,foundit=None):
             foundit.set()
             break
 
+def tableMatrix(lookupRaw):
+    """Converts a lookup table to a matrix of hex digits (one row per element)
+    Parameters
+    ----------
+    lookupRaw : list
+        Lookup table (as from readLookFromFile())
+    Returns
+    -------
+    numpy.ndarray
+        uint8 matrix of shape (len(lookupRaw), len(lookupRaw[0])), values 0-15
+    """
+    import numpy as np
+    matrix = np.frombuffer(''.join(lookupRaw).encode(), dtype=np.uint8).reshape(len(lookupRaw), -1) - ord('0')
+    matrix[matrix > 9] -= ord('a') - ord('0') - 10
+    return matrix
+
+def colsUnique(matrix,cols):
+    """Checks if the rows of matrix restricted to columns cols are all unique
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        Hex digit matrix from tableMatrix()
+    cols : list
+        Column indices to keep
+    Returns
+    -------
+    bool
+        If there are no duplicates
+    """
+    import numpy as np
+    sub = matrix[:, cols]
+    if len(cols) <= 16:
+        #pack hexes into one integer key per row
+        keys = np.zeros(len(sub), dtype=np.uint64)
+        for k in range(len(cols)):
+            keys = (keys << np.uint64(4)) | sub[:, k]
+    else:
+        keys = np.ascontiguousarray(sub).view(np.dtype((np.void, len(cols)))).ravel()
+    keys = np.sort(keys)
+    return not (keys[1:] == keys[:-1]).any()
+
+def truncateNp(matrix):
+    """Truncates lookuptable iteratively, as truncate() but on a hex digit matrix
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        Hex digit matrix from tableMatrix()
+    Returns
+    -------
+    int
+        Number of rightmost hexes needed to keep all elements unique
+    """
+    width = matrix.shape[1]
+    for i in range(1, width):
+        if colsUnique(matrix, list(range(width-i, width))):
+            return i
+
+def truncHeurNp(matrix,target,quit=None,foundit=None):
+    """Truncates lookuptable with random heuristic, as truncHeur() but on a hex digit matrix.
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        Hex digit matrix from tableMatrix()
+    target : int
+        Number of hex indices to pick.
+    quit : multiprocessing.event
+        Stops loop when found solution
+    foundit : multiprocessing.event
+        Set when found solution
+    Returns
+    -------
+    selInd
+        Hex indices keeping all elements unique, None if stopped
+    """
+    if quit == None:
+        quit = mp.Event()
+        foundit = mp.Event()
+    i = 0
+    start = time.time()
+    while not quit.is_set():
+        i+=1
+        selInd = random.sample(range(2,matrix.shape[1]),target)
+        selInd.sort(reverse=True)
+        if colsUnique(matrix, selInd):
+            print ("Found combination: " +str(selInd))
+            print("Tries/sec:" + str(i/(time.time()-start)))
+            foundit.set()
+            return selInd
+    return None
+
 def truncTest(rng,diff=1):
-    """First truncates using truncate(), then truncates using truncHeur().
+    """First truncates using truncateNp(), then truncates using truncHeurNp().
     Parameters
     ----------
     rng : int
@@ -345,15 +965,126 @@ def truncTest(rng,diff=1):
         Sets the difficulty of the search. Typically is 1. If set to 2 might take very long.
     Returns
     -------
-    None
+    selInd
+        Hex indices found by truncHeurNp()
+    """
+    matrix = readMatrixFromFile(str(CURVENUMBER)+'-'+str(rng)+'bits.txt')
+    width = truncateNp(matrix)
+    print("Naive truncate:" + str(width))
+    return truncHeurNp(matrix,width-diff)
+
+def _unrankCombination(rank,n,k):
+    """Returns the combination of k out of range(n) with lexicographic rank rank"""
+    combo = []
+    x = 0
+    for remaining in range(k,0,-1):
+        while math.comb(n-x-1,remaining-1) <= rank:
+            rank -= math.comb(n-x-1,remaining-1)
+            x+=1
+        combo.append(x)
+        x+=1
+    return combo
+
+def _truncHeurWorker(shmname,shape,target,worker,cores,quit,results):
+    """Tests every cores-th hex index combination starting at worker (see truncHeurPool())"""
+    import numpy as np
+    from multiprocessing import shared_memory
+    shm = None
+    tries = 0
+    found = None
+    error = None
+    start = time.time()
+    try:
+        shm = shared_memory.SharedMemory(name=shmname)
+        matrix = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        n = shape[1]-2 #first two hexes are the compression prefix
+        total = math.comb(n,target)
+        #visit ranks in a scattered but fixed order, so consecutive tries share few indices
+        mult = 0x9E3779B97F4A7C15 % total if total > 1 else 1
+        while math.gcd(mult,total) != 1:
+            mult+=1
+        for rank in range(worker,total,cores):
+            if tries % 16 == 0 and quit.is_set():
+                break
+            tries+=1
+            selInd = sorted((2+x for x in _unrankCombination(rank*mult % total,n,target)),reverse=True)
+            if colsUnique(matrix, selInd):
+                found = selInd
+                quit.set()
+                break
+        del matrix
+    except Exception as e:
+        error = repr(e)
+        quit.set()
+    finally:
+        #always report, the parent waits for one result per worker
+        results.put((worker, found, tries, time.time()-start, error))
+        if shm != None:
+            shm.close()
+
+def truncHeurPool(matrix,target,cores=mp.cpu_count()):
+    """Searches hex index combinations keeping all elements unique using multiple cores.
+       The matrix is placed once in shared memory, and the combinations are split
+       between workers so none is tested twice. All workers stop on first success.
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        Hex digit matrix from tableMatrix()
+    target : int
+        Number of hex indices to pick.
+    cores : int
+        Number of cores to be used
+    Example: truncHeurPool(tableMatrix(readLookFromFile(16)),4)
+    Returns
+    -------
+    dict
+        'selInd': winning hex indices (None if no combination works),
+        'stats': tries, seconds and tries/sec of each worker
     """
-    f = readLookFromFile(rng)
-    a1 = truncate(f) 
-    print("Naive truncate:" + str(len(a1[0])))
-    truncHeur(f,len(a1[0])-diff)
+    import numpy as np
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    try:
+        np.ndarray(matrix.shape, dtype=np.uint8, buffer=shm.buf)[:] = matrix
+        quit = mp.Event()
+        results = mp.Queue()
+        procs = [mp.Process(target=_truncHeurWorker, args=(shm.name, matrix.shape, target, w, cores, quit, results))
+                 for w in range(cores)]
+        for p in procs:
+            p.start()
+        selInd = None
+        stats = []
+        errors = []
+        while len(stats) < len(procs):
+            try:
+                worker, found, tries, elapsed, error = results.get(timeout=1)
+            except queue.Empty:
+                #a worker killed without reporting would otherwise be waited for forever
+                if all(not p.is_alive() for p in procs) and results.empty():
+                    quit.set()
+                    raise RuntimeError("truncHeurPool: worker exited without a result (exit codes "
+                                       + str([p.exitcode for p in procs]) + ")")
+                continue
+            if error != None:
+                errors.append("worker " + str(worker) + ": " + error)
+            if found != None and selInd == None:
+                selInd = found
+            stats.append({'worker':worker, 'tries':tries, 'sec':round(elapsed,3),
+                          'tries/sec':tries/elapsed if elapsed > 0 else 0.0})
+        for p in procs:
+            p.join()
+        if errors and selInd == None:
+            raise RuntimeError("truncHeurPool: " + "; ".join(errors))
+    finally:
+        shm.close()
+        shm.unlink()
+    stats.sort(key=lambda st: st['worker'])
+    print ("Found combination: " +str(selInd))
+    print("Tries/sec:" + str(sum(st['tries/sec'] for st in stats)))
+    return {'selInd':selInd, 'stats':stats}
 
 def truncTestMult(rng,diff=1,cores=mp.cpu_count()):
-    """First truncates using truncate(), then truncates using truncHeur() using multiple cores.
+    """First truncates using truncateNp(), then truncates using truncHeurPool() using multiple cores.
     Parameters
     ----------
     rng : int
@@ -362,21 +1093,16 @@ def truncTestMult(rng,diff=1,cores=mp.cpu_count()):
         Sets the difficulty of the search. Typically is 1. If set to 2 might take very long.
     cores : int
         Number of cores to be used
-    Example: truncTestMult(1000000,2,6)
+    Example: truncTestMult(20,2,6)
     Returns
     -------
-    None
+    selInd
+        Hex indices found by truncHeurPool()
     """
-    f = readLookFromFile(rng)
-    a1 = truncate(f)
-    print("Naive truncate:" + str(len(a1[0])))
-    quit = mp.Event()
-    foundit = mp.Event()
-    for _ in range(cores):
-        p = mp.Process(target=truncHeur, args=(f, len(a1[0])-diff, quit, foundit))
-        p.start()
-    foundit.wait()
-    quit.set()
+    matrix = readMatrixFromFile(str(CURVENUMBER)+'-'+str(rng)+'bits.txt')
+    width = truncateNp(matrix)
+    print("Naive truncate:" + str(width))
+    return truncHeurPool(matrix,width-diff,cores)['selInd']
 
 def truncateR(table,hexes):
     """Truncates table from MSB side.
@@ -441,6 +1167,46 @@ def countSizes(lst):
             countdict.update({len(elm):1})
     return countdict
 
+def _lcp(a,b):
+    """Returns length of the longest common prefix of two hex strings"""
+    if len(a) != len(b):
+        return len(os.path.commonprefix([a,b]))
+    if a == b:
+        return len(a)
+    return len(a) - ((int(a,16) ^ int(b,16)).bit_length()+3)//4
+
+def truncVarSorted(table,minhexes=1):
+    """Truncates using variable length with a single sort.
+       Each element keeps one hex more than its longest common prefix with its
+       neighbours in sorted order, which is the shortest prefix no other element shares.
+    Parameters
+    ----------
+    table : list
+        List to be truncated
+    minhexes : int
+        Minimum number of hexes kept for each element
+    Returns
+    -------
+    outList
+        Truncated List (elements equal to another element are kept whole)
+    """
+    order = sorted(range(len(table)), key=table.__getitem__)
+    depth = [0]*len(table) #longest common prefix with any other element
+    for k in range(1,len(order)):
+        a, b = order[k-1], order[k]
+        common = _lcp(table[a],table[b])
+        if common > depth[a]:
+            depth[a] = common
+        if common > depth[b]:
+            depth[b] = common
+    return [elem[:max(minhexes,depth[idx]+1)] for idx, elem in enumerate(table)]
+
+def _rightTrunc(filename):
+    """Returns naive truncate width of table file (see truncateNp()) and the rightmost
+       width hexes of each element, streaming the file instead of loading it as a list"""
+    width = truncateNp(readMatrixFromFile(filename))
+    return width, [elem[-width:] for chunk in iterLookFromFile(filename) for elem in chunk]
+
 def truncVar(rng):
     """Truncates using variable length.
     Parameters
@@ -452,49 +1218,259 @@ def truncVar(rng):
     outList
         Truncated List
     """
-    f = readLookFromFile(rng)
-    a1 = truncate(f)
-    print("Naive truncate: " + str(len(a1[0])) +" hexes")
+    width, a1 = _rightTrunc(str(CURVENUMBER)+'-'+str(rng)+'bits.txt')
+    print("Naive truncate: " + str(width) +" hexes")
     reprhexes = math.ceil(math.log(len(a1)+1,16)) -1 #minimum (ideal) hexes needed to represent
     print("Ideal truncate: " + str(reprhexes) +" hexes")
-    outList = [] #unique elements will go here
-    for idx in range(2**rng -1):
-        outList.append(None)
-    while checkNoneList(outList): #check if everything has moved in outList
-        dupedict = {} #map of occurences
-        tempList = truncateR(a1,reprhexes) #first truncate to minimum hexes
-        for elem in tempList: #count occurences in tempList
-            if elem in dupedict and elem != None:
-                dupedict[elem]+=1
-            elif elem != None:
-                dupedict.update({elem:1})
-        for idx,elem in enumerate(tempList): #move unique elements from tempList to outList
-            if outList[idx] == None and dupedict[elem] == 1:
-                outList[idx] = elem
-        reprhexes +=1 #add another hex representation
-    return outList
+    return truncVarSorted(a1,reprhexes)
+
+TRIEMAGIC = b'DLOGTRIE'
+TRIEHEADER = struct.Struct('<8sqQQQB7x') #magic, key offset, node count, inner node count, value count, bytes per value
+
+def _popcount(x):
+    """Returns number of set bits of integer x"""
+    return bin(x).count('1')
+
+class PrefixTrie:
+    """
+    Succinct hex trie mapping variable-length truncated entries to their discrete logs
+    ...
+    Nodes are numbered in breadth-first order, children of a node being consecutive.
+    No child pointers are stored: a node's first child is found by counting the children
+    of the inner nodes before it, using the rank directories. Every offset is 64-bit.
+    Attributes
+    ----------
+    inner : bytes
+        Bit per node, set for inner nodes (least significant bit first)
+    rankdir : array
+        Number of inner nodes before each block of 512 nodes
+    masks : array
+        Bitmap of the hex digits each inner node has children for
+    childdir : array
+        Number of children of the inner nodes before each block of 16 inner nodes
+    values : bytes
+        Discrete log of each leaf, vbytes bytes each (big endian)
+    vbytes : int
+        Bytes per value (ceil(log2(largest value + 1)/8))
+    offset : int
+        Keys are elem[offset:] (e.g. -width for tables truncated with truncate())
+    """
+    def __init__(self, inner, rankdir, masks, childdir, values, vbytes, nodes, offset=0):
+
+        """
+        Parameters
+        ----------
+        inner, rankdir, masks, childdir, values : bytes, array or memoryview
+            Trie arrays, as built by PrefixTrie.build()
+        vbytes : int
+            Bytes per value
+        nodes : int
+            Number of nodes
+        offset : int
+            Keys are elem[offset:]
+        """
+        self.inner = inner
+        self.rankdir = rankdir
+        self.masks = masks
+        self.childdir = childdir
+        self.values = values
+        self.vbytes = vbytes
+        self.nodes = nodes
+        self.offset = offset
+
+    @classmethod
+    def build(cls, prefixes, values, offset=0):
+        """Builds a trie from prefix-free hex prefixes and their (non-negative) values
+        Example:
+        t = PrefixTrie.build(['0a','0b','1'], [1,2,3])
+        """
+        items = sorted(zip(prefixes, values))
+        inner = bytearray()
+        masks = array.array('H')
+        vals = []
+        nodes = 0
+        level = [(0, len(items))] if items else [] #slices of items below each node
+        depth = 0
+        while level:
+            nextlevel = []
+            for lo, hi in level:
+                if nodes % 8 == 0:
+                    inner.append(0)
+                if len(items[lo][0]) == depth:
+                    if hi-lo > 1:
+                        raise ValueError("Prefix " + items[lo][0] + " is not unique or is a prefix of another")
+                    vals.append(items[lo][1])
+                    nodes+=1
+                    continue
+                inner[-1] |= 1 << (nodes % 8)
+                nodes+=1
+                mask = 0
+                start = lo
+                while start < hi:
+                    nib = items[start][0][depth]
+                    end = start
+                    while end < hi and items[end][0][depth] == nib:
+                        end+=1
+                    mask |= 1 << int(nib,16)
+                    nextlevel.append((start, end))
+                    start = end
+                masks.append(mask)
+            level = nextlevel
+            depth+=1
+        inner.extend(bytes(-len(inner) % 64)) #whole rank blocks
+        rankdir = array.array('Q')
+        count = 0
+        for pos in range(0, len(inner), 64):
+            rankdir.append(count)
+            count += _popcount(int.from_bytes(inner[pos:pos+64], 'little'))
+        childdir = array.array('Q')
+        count = 0
+        for k, mask in enumerate(masks):
+            if k % 16 == 0:
+                childdir.append(count)
+            count += _popcount(mask)
+        vbytes = max(1, (max(vals, default=0).bit_length()+7)//8)
+        values = b''.join(v.to_bytes(vbytes, 'big') for v in vals)
+        return cls(bytes(inner), rankdir, masks, childdir, values, vbytes, nodes, offset)
+
+    def __len__(self):
+        return len(self.values)//self.vbytes
+
+    def nbytes(self):
+        """Returns size of the trie arrays in bytes"""
+        return (len(self.inner) + 8*len(self.rankdir) + 2*len(self.masks)
+                + 8*len(self.childdir) + len(self.values))
+
+    def _rank(self, node):
+        """Returns number of inner nodes numbered below node"""
+        block = node >> 9
+        count = self.rankdir[block]
+        end = node >> 3
+        if end > block << 6:
+            count += _popcount(int.from_bytes(self.inner[block << 6:end], 'little'))
+        if node & 7:
+            count += _popcount(self.inner[end] & ((1 << (node & 7))-1))
+        return count
+
+    def _value(self, node):
+        leaf = node - self._rank(node)
+        return int.from_bytes(self.values[leaf*self.vbytes:(leaf+1)*self.vbytes], 'big')
+
+    def lookup(self, elem):
+        """Returns discrete log of hex element elem, None if no stored prefix matches"""
+        if self.nodes == 0:
+            return None
+        node = 0
+        for ch in elem[self.offset:]:
+            if not (self.inner[node >> 3] >> (node & 7)) & 1:
+                return self._value(node)
+            rank = self._rank(node)
+            mask = self.masks[rank]
+            nib = int(ch,16)
+            if not (mask >> nib) & 1:
+                return None
+            child = self.childdir[rank >> 4]
+            for k in range(rank & ~15, rank):
+                child += _popcount(self.masks[k])
+            node = 1 + child + _popcount(mask & ((1 << nib)-1))
+        if not (self.inner[node >> 3] >> (node & 7)) & 1:
+            return self._value(node)
+        return None
+
+    def save(self, filename):
+        """Saves trie to file (little endian arrays after a header)"""
+        with open(filename, 'wb') as filehandle:
+            filehandle.write(TRIEHEADER.pack(TRIEMAGIC, self.offset, self.nodes, len(self.masks),
+                                             len(self), self.vbytes))
+            for arr in (self.inner, self.rankdir, self.masks, self.childdir, self.values):
+                if not isinstance(arr, (bytes, bytearray)):
+                    arr = array.array(arr.format if isinstance(arr, memoryview) else arr.typecode, arr)
+                    if sys.byteorder != 'little':
+                        arr.byteswap()
+                    arr = arr.tobytes()
+                filehandle.write(arr)
+                filehandle.write(bytes(-filehandle.tell() % 8))
+
+    @classmethod
+    def load(cls, filename):
+        """Loads trie saved by save(), memory-mapping its arrays"""
+        with open(filename, 'rb') as filehandle:
+            mm = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, nodes, inners, leaves, vbytes = TRIEHEADER.unpack_from(mm, 0)
+        if magic != TRIEMAGIC:
+            raise ValueError(str(filename) + " is not a trie file")
+        innerlen = ((nodes+7)//8 + 63)//64*64
+        arrays = []
+        pos = TRIEHEADER.size
+        for code, size in ((None, innerlen), ('Q', 8*(innerlen//64)), ('H', 2*inners),
+                           ('Q', 8*((inners+15)//16)), (None, leaves*vbytes)):
+            view = memoryview(mm)[pos:pos+size]
+            if code == None:
+                arrays.append(view)
+            elif sys.byteorder == 'little':
+                arrays.append(view.cast(code))
+            else:
+                arr = array.array(code, view.tobytes())
+                arr.byteswap()
+                arrays.append(arr)
+            pos += size + (-(pos+size) % 8)
+        inner, rankdir, masks, childdir, values = arrays
+        return cls(inner, rankdir, masks, childdir, values, vbytes, nodes, offset)
+
+def buildVarTrie(rng,filename=None):
+    """Builds a PrefixTrie from the variable-length truncation of truncVar().
+    Parameters
+    ----------
+    rng : int
+        Range size to be read from file
+    filename : string
+        Saves the trie to this file if given
+    Example: t = buildVarTrie(16); t.lookup(str(455*PP.g))
+    Returns
+    -------
+    PrefixTrie
+    """
+    #as truncVar(): keep the rightmost naive truncate hexes, then truncate from the left
+    width, a1 = _rightTrunc(str(CURVENUMBER)+'-'+str(rng)+'bits.txt')
+    outList = truncVarSorted(a1, math.ceil(math.log(len(a1)+1,16)) -1)
+    t = PrefixTrie.build(outList, range(1,len(outList)+1), -width)
+    if filename != None:
+        t.save(filename)
+    return t
+
+def isLog(x,gx):
+    """Checks if x is the discrete log of gx (EcPt), i.e. x*PP.g == gx"""
+    return Bn.from_decimal(str(x))*PP.g == gx
 
 def lookup(lookupTable,gx):
     """
-    Looks up element gx from lookupTable
+    Looks up element gx from lookupTable (list or LookupDict)
     Example:
     f = readLookFromFileB("714-0to16bits.txt")
     lookup(f,'03fa8711c01451a67ab233a2e5503445216e3d663d23d2a9faf0b01889aa330249')
     """
+    if isinstance(lookupTable, LookupDict):
+        for idx in lookupTable.indices(gx):
+            if str(Bn.from_decimal(str(idx+1))*PP.g) == gx:
+                return idx
+        raise ValueError(str(gx) + " is not in table")
     return (lookupTable.index(gx))
 
-def babygiantstep(lookupTable,gx,giantstepsize):
+def babygiantstep(lookupTable,gx,giantstepsize,fallbackbits=None):
     """
     Do baby and giant steps according to Shank's algorithm.
     Prints result to stdout.
     Parameters
     ----------
-    lookipTable : list
+    lookipTable : list or LookupDict
         babystep lookuptable
     gx: string
         Value to decrypt
     giantstepsize: int
         giant step parameter beta
+    fallbackbits: int
+        If set, values up to fallbackbits bits past the giant steps are searched
+        with kangaroo()
     Returns
     -------
     None
@@ -513,39 +1489,108 @@ def babygiantstep(lookupTable,gx,giantstepsize):
     babygiantstep(f,131547*PP.g,2**8)
     '''
     i = 1
+    gx0 = gx
     gstp = giantstepsize*PP.g
-    while i <= giantstepsize:
-        try:
-            res = (i-1)*giantstepsize + lookupTable.index(str(gx)) +1
-            print(res)
-            break
-        except ValueError:
+    if isinstance(lookupTable, LookupDict):
+        res = None
+        while i <= giantstepsize:
+            for idx in lookupTable.indices(str(gx)):
+                if isLog((i-1)*giantstepsize + idx +1, gx0):
+                    res = (i-1)*giantstepsize + idx +1
+            if res != None:
+                print(res)
+                break
             gx = gx - gstp
             i+=1
+    else:
+        while i <= giantstepsize:
+            try:
+                res = (i-1)*giantstepsize + lookupTable.index(str(gx)) +1
+                print(res)
+                break
+            except ValueError:
+                gx = gx - gstp
+                i+=1
+    METRICS.inc('giant_steps', min(i, giantstepsize))
     if i == giantstepsize+1:
-        print("Not found")
+        res = None
+        if fallbackbits != None:
+            res = kangaroo(gx0,*_fallbackRange(len(lookupTable),giantstepsize,giantstepsize,fallbackbits))
+        print("Not found" if res == None else res)
 
-def checkNoneList(lst):
-    """Check if list has any None types.
+def babygiantstepbatch(lookupTable,gxs,giantstepsize):
+    """
+    Do baby and giant steps according to Shank's algorithm for many values at once.
+    Each giant step makes a single pass over lookupTable for all pending values.
     Parameters
     ----------
-    lst : lst
-        List to be checked
+    lookupTable : list or LookupDict
+        babystep lookuptable
+    gxs: list
+        Values (EcPt) to decrypt
+    giantstepsize: int
+        giant step parameter beta
+    Example: babygiantstepbatch(f,[14335*PP.g,131547*PP.g],2**8)
     Returns
     -------
-    bool
+    list
+        Decrypted values, None for values not found
     """
-    for elem in lst:
-        if elem == None:
-            return True
+    results = [None]*len(gxs)
+    pending = dict(enumerate(gxs))
+    gstp = giantstepsize*PP.g
+    i = 1
+    while i <= giantstepsize and pending:
+        if isinstance(lookupTable, LookupDict):
+            for j, gx in list(pending.items()):
+                for idx in lookupTable.indices(str(gx)):
+                    if isLog((i-1)*giantstepsize + idx +1, gxs[j]):
+                        results[j] = (i-1)*giantstepsize + idx +1
+                if results[j] != None:
+                    del pending[j]
+                else:
+                    pending[j] = gx - gstp
+            i+=1
+            continue
+        wanted = {}
+        for j, gx in pending.items():
+            wanted.setdefault(str(gx),[]).append(j)
+        for idx, elem in enumerate(lookupTable):
+            if elem in wanted:
+                for j in wanted.pop(elem):
+                    results[j] = (i-1)*giantstepsize + idx +1
+                    del pending[j]
+                if not wanted:
+                    break
+        for j in pending:
+            pending[j] = pending[j] - gstp
+        i+=1
+    return results
+
+def checkNoneList(lst):
+    """Check if list has any None types.
+    Parameters
+    ----------
+    lst : lst
+        List to be checked
+    Returns
+    -------
+    bool
+    """
+    for elem in lst:
+        if elem == None:
+            return True
     return False
 
-def checkDupsFile(filename):
+def checkDupsFile(filename,mode='str'):
     """Checks if a file contains any duplicates
     Parameters
     ----------
     filehandle : string
         File to be checked
+    mode : string
+        How elements are kept in memory (see iterLookFromFile()).
+        'bytes' halves memory for even length lines.
     Example: checkDupsFile("714-1to65536.txt.trunc")
     Returns
     -------
@@ -555,17 +1600,15 @@ def checkDupsFile(filename):
     setOfElems = set()
     i=0
     start = time.time()
-    with open(str(filename), 'r') as filehandle:
-        for line in filehandle:
-            #elem = bytes.fromhex(line[:-1])
-            elem = line[:-1]
+    for chunk in iterLookFromFile(str(filename),10000,mode):
+        for elem in chunk:
             if elem in setOfElems:
                 print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
                 return True
             else:
                 setOfElems.add(elem)
-            i+=1
-            if i % 10000 ==0: print(i,end='\r',flush=True)
+        i+=len(chunk)
+        print(i,end='\r',flush=True)
     print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
     return False
 
@@ -624,6 +1667,109 @@ def checkDupsFileparts(numfiles,resi=1,resj=2):
             f.close()
     print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
 
+def _readRun(filename,reclen,bufsize=2**20):
+    """Yields fixed-length records from a sorted run file"""
+    with open(filename, 'rb') as filehandle:
+        while True:
+            data = filehandle.read(reclen*(bufsize//reclen))
+            if not data:
+                return
+            for k in range(0,len(data),reclen):
+                yield data[k:k+reclen]
+
+def _mergeRuns(runs,reclen,bufsize,outname):
+    """Merges sorted run files into outname, deleting them"""
+    with open(outname, 'wb', buffering=bufsize) as outfile:
+        for rec in heapq.merge(*[_readRun(r,reclen,bufsize) for r in runs]):
+            outfile.write(rec)
+    for r in runs:
+        os.remove(r)
+    return outname
+
+def checkDupsExternal(filenames,truncvalue=None,ram=2**30,outfile="dupsresults.txt",fanin=256):
+    """
+    Checks for duplicates across truncated binary file parts with bounded memory.
+    Entries are sorted in runs that fit in ram, then the runs are merged at most
+    fanin at a time (in several passes if needed), so equal entries become adjacent.
+    Writes results to file.
+    Parameters
+    ----------
+    filenames : list
+        Truncated binary files (raw or with header), in table order
+    truncvalue : int
+        Truncation parameter (in hexes). Read from the headers of binary table files.
+    ram : int
+        Memory budget for sorting (in bytes)
+    outfile : string
+        File to append duplicates to
+    fanin : int
+        Most run files open at once while merging. Each gets a read buffer of ram/(fanin+1) bytes.
+    Example: checkDupsExternal(["part"+str(i)+".bin" for i in range(1,17)],16,2**32)
+    Returns
+    -------
+    list
+        (entry in hex, index of first occurrence, index of duplicate) for each duplicate
+    """
+    start = time.time()
+    dups = []
+    with TruncTable(truncvalue,filenames) as table, \
+         tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(outfile))) as tmpdir:
+        width = table.width
+        reclen = width + 8 #entry, then big endian index keeps equal entries in table order
+        runlen = max(1, ram//(reclen+64)) #bytes objects and list slots cost ~64 bytes each
+        runs = []
+        run = []
+        def flushrun():
+            run.sort()
+            runs.append(os.path.join(tmpdir,str(len(runs))))
+            with open(runs[-1], 'wb') as runfile:
+                runfile.write(b''.join(run))
+            run.clear()
+        for i, mm in enumerate(table.parts):
+            if mm == None:
+                continue
+            datastart = table.starts[i]
+            end = len(mm) - (len(mm)-datastart) % width
+            num = table.offsets[i]
+            step = width*min(2**16,runlen)
+            for pos in range(datastart, end, step):
+                chunk = mm[pos:min(pos+step,end)]
+                for k in range(0,len(chunk),width):
+                    num+=1
+                    run.append(chunk[k:k+width] + num.to_bytes(8,'big'))
+                if len(run) >= runlen:
+                    flushrun()
+                    print("Sorted runs: "+str(len(runs)),end='\r',flush=True)
+        if run:
+            flushrun()
+        del run[:]
+        merged = 0
+        while len(runs) > fanin:
+            bufsize = max(reclen, ram//(fanin+1)) #fanin inputs and one output
+            nextruns = []
+            for k in range(0, len(runs), fanin):
+                merged+=1
+                nextruns.append(_mergeRuns(runs[k:k+fanin], reclen, bufsize,
+                                           os.path.join(tmpdir,"m"+str(merged))))
+            runs = nextruns
+            print("Merged runs: "+str(len(runs)),end='\r',flush=True)
+        bufsize = max(reclen, ram//max(1,len(runs)))
+        prevkey, previdx = None, None
+        for rec in heapq.merge(*[_readRun(r,reclen,bufsize) for r in runs]):
+            key = rec[:width]
+            idx = int.from_bytes(rec[width:],'big')
+            if key == prevkey:
+                dups.append((key.hex(),previdx,idx))
+            else:
+                prevkey, previdx = key, idx
+    with open(outfile, "a") as f:
+        for elem, i, j in dups:
+            f.write(str(elem)+ "\n")
+            f.write(str(i)+"-"+str(j)+ "\n")
+        f.write("Completed: "+str(len(filenames))+" files, "+str(len(dups))+" duplicates\n")
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return dups
+
 def cremptyfile(filename,linenums,linelen,char=" "):
     """
     Creates an empty file with a specified number of lines.
@@ -810,10 +1956,11 @@ def lookup2FileResB(rng):
         startIdx = 1
     with open(outfilename, 'a') as filehandle:
         temp = startIdx*PP.g
+        progress = Progress(rng, startIdx, counter = 'points', phase = 'generate')
         for i in range(startIdx, rng):
             filehandle.write('%s\n' % str(temp))
             temp = temp + PP.g
-            printProgressBar(i + 1, rng, prefix = 'Progress:', suffix = 'Complete', length = 50)
+            progress.update(i + 1)
 
 def lookupelemtruncl(filename,elem,truncvalue):
     """
@@ -844,16 +1991,16 @@ def babygiantsteptrunc(filename,gx,truncvalue,giantstepsize):
 
 def lookupelemtrunclfileparts(elem,truncvalue):
     """
-    Run lookupelemtruncl() across 16 fileparts
+    Run lookupelemtruncl() across all fileparts (see findParts())
     (16 is recommended for typical 2^32 range)
     """
-    result = None
-    for i in range(1,17):
-        print(i)
-        if result == None:
-            result = lookupelemtruncl("part"+str(i),elem,truncvalue)
-            if result != None:
-                return result + ((i-1)*2**28)
+    offset = 0
+    for filename in findParts(""):
+        print(filename)
+        result = lookupelemtruncl(filename,elem,truncvalue)
+        if result != None:
+            return result + offset
+        offset += os.path.getsize(filename)//(truncvalue+1) #one line per entry
 
 def hextobin(infile,outfile):
     '''
@@ -865,72 +2012,1098 @@ def hextobin(infile,outfile):
             filename.write(binascii.unhexlify(line[:-1]))
         filename.close()
 
+def hex2bin(inputfile,truncvalue,side='left',outfile=None,header=False,first=1,blocklines=2**20):
+    '''
+    Truncate raw hex table and convert it to binary in one pass
+    (truncNomemleft() or truncNomem() followed by hextobin()).
+    Reads blocklines lines at a time and packs each block with a single conversion.
+    Parameters
+    ----------
+    inputfile : string
+        Raw table (one hex element per line)
+    truncvalue : int
+        Truncation parameter (in hexes). Odd values are padded with a zero nibble.
+    side : string
+        'left' keeps the hexes after the compression prefix (as truncNomemleft()),
+        'right' keeps the last hexes (as truncNomem())
+    outfile : string
+        Output file (inputfile.truncl.bin or inputfile.trunc.bin if None)
+    header : bool
+        Write a binary table header (see writeTableHeader())
+    first : int
+        Value of the first line, recorded in the header
+    Example: hex2bin("part1",16,outfile="part1.bin")
+    Returns
+    -------
+    int
+        Number of entries written
+    '''
+    if outfile == None:
+        outfile = inputfile + (".truncl.bin" if side == 'left' else ".trunc.bin")
+    pad = '0' if truncvalue % 2 else ''
+    count = 0
+    with open(outfile, 'wb', buffering=2**24) as filehandle:
+        truncoffset = None
+        for lines in iterLookFromFile(inputfile,blocklines):
+            if truncoffset == None:
+                truncoffset = 2 if side == 'left' else len(lines[0])-truncvalue
+                if header:
+                    writeTableHeader(filehandle,first,0,truncvalue,truncoffset) #count set at the end
+            filehandle.write(bytes.fromhex(pad.join(line[truncoffset:truncoffset+truncvalue] for line in lines) + pad))
+            count += len(lines)
+        if header:
+            filehandle.seek(0)
+            writeTableHeader(filehandle,first,count,truncvalue,2 if truncoffset == None else truncoffset)
+    return count
+
+def _hex2binPart(args):
+    """Converts one part (worker of hex2binParts())"""
+    filename, truncvalue, side, header, first = args
+    return hex2bin(filename,truncvalue,side,filename+".bin",header,first)
+
+def hex2binParts(truncvalue,side='left',header=False,cores=mp.cpu_count()):
+    '''
+    Run hex2bin() on all text parts (see findParts()) in parallel, writing partN.bin
+    Example: hex2binParts(16)
+    '''
+    start = time.time()
+    tasks = []
+    first = 1
+    for filename in findParts(""):
+        with open(filename, 'r') as filehandle:
+            linelen = len(filehandle.readline())
+        tasks.append((filename, truncvalue, side, header, first))
+        if linelen:
+            first += os.path.getsize(filename)//linelen #fixed length lines
+    with mp.Pool(cores) as pool:
+        counts = pool.map(_hex2binPart, tasks)
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return sum(counts)
+
 def lookupnumtrunclbin(filename,num,truncvalue):
     '''Returns binary value at position num'''
     with open(str(filename), 'rb') as filehandle:
+        header = readTableHeader(filehandle)
+        if header != None:
+            filehandle.seek(header['start'] + (num-1)*header['width'])
+            return filehandle.read(header['width'])
         filehandle.seek((num-1)*(truncvalue+1))
         return filehandle.read(truncvalue)
 
 def lookupelemtrunclbin(filename,elem,truncvalue):
     '''Returns position of elem in binary file'''
     with open(str(filename), 'rb') as filehandle:
+        header = readTableHeader(filehandle)
+        truncoffset = 2
+        if header != None:
+            truncvalue, truncoffset = header['truncvalue'], header['truncoffset']
+        key = truncKey(elem,truncvalue,truncoffset)
         counter = 0
         while True:
             counter+=1
-            bytegroup = filehandle.read(int(truncvalue/2))
-            if elem[2:2+truncvalue] == bytegroup.hex():
+            bytegroup = filehandle.read(len(key))
+            if key == bytegroup:
+                METRICS.inc('bytes_scanned', counter*len(key))
                 return counter
             elif bytegroup == b'':
+                METRICS.inc('bytes_scanned', counter*len(key))
                 return None
 
-def lookupelemtrunclfilepartsbin(elem,truncvalue):
+TBLMAGIC = b'DLOGTBL1'
+#magic, curve, truncation offset (hexes), truncation value (hexes), entry width (bytes),
+#value of first entry, entry count, range of whole table
+TBLHEADER = struct.Struct('>8sHHHHQQQ24x')
+IDXMAGIC = b'DLOGIDX1'
+#magic, truncation value (hexes), truncation offset (hexes), directory bits, entry count
+IDXHEADER = struct.Struct('>8sHHBQ')
+IDXPOS = struct.Struct('>I') #position of entry (1-based) in truncated binary file
+
+def truncKey(elem,truncvalue,offset=2):
+    """Converts a hex element to the binary key stored in truncated binary tables
+    Parameters
+    ----------
+    elem : string
+        Element in hex (as in str(EcPt))
+    truncvalue : int
+        Truncation parameter (in hexes)
+    offset : int
+        First hex to keep (2 skips the compression prefix, as in truncNomemleft())
+    Returns
+    -------
+    bytes
+        Truncated key, padded with a zero nibble if truncvalue is odd
+    """
+    hexes = elem[offset:offset+truncvalue]
+    if len(hexes) % 2:
+        hexes += '0'
+    return bytes.fromhex(hexes)
+
+def writeTableHeader(filehandle,first,count,truncvalue,truncoffset=2,rng=None):
+    """Writes the header of a binary table file
+    Parameters
+    ----------
+    filehandle : file
+        Binary file opened for writing, at position 0
+    first : int
+        Value (discrete log) of first entry, i.e. the baby-step origin
+    count : int
+        Number of entries
+    truncvalue, truncoffset : int
+        Entries are elem[truncoffset:truncoffset+truncvalue] (in hexes), see truncKey()
+    rng : int
+        Range of the whole table (count if None)
+    Returns
+    -------
+    None
     """
-    Returns position of elem in 16 truncated file parts.
+    if rng == None:
+        rng = count
+    filehandle.write(TBLHEADER.pack(TBLMAGIC,CURVENUMBER,truncoffset,truncvalue,(truncvalue+1)//2,first,count,rng))
+
+def readTableHeader(filehandle):
+    """Reads the header of a binary table file, leaving filehandle at the first entry
+    Parameters
+    ----------
+    filehandle : file
+        Binary file opened for reading, at position 0
+    Returns
+    -------
+    dict
+        Header fields, None for raw files without header (filehandle is left at 0)
+    """
+    data = filehandle.read(TBLHEADER.size)
+    if len(data) < TBLHEADER.size or data[:len(TBLMAGIC)] != TBLMAGIC:
+        filehandle.seek(0)
+        return None
+    _, curve, truncoffset, truncvalue, width, first, count, rng = TBLHEADER.unpack(data)
+    return {'curve':curve, 'truncoffset':truncoffset, 'truncvalue':truncvalue, 'width':width,
+            'first':first, 'count':count, 'rng':rng, 'start':TBLHEADER.size}
+
+def _idxbucket(key,dirbits):
+    """Returns the directory bucket of a key (its first dirbits bits)"""
+    return int.from_bytes(key[:3].ljust(3,b'\0'),'big') >> (24-dirbits)
+
+def buildTruncIndex(filename,truncvalue,dirbits=None):
+    """Builds a sorted index with a prefix directory for a truncated binary file.
+       Saves it to filename.idx
+    Index layout: header, directory of 2^dirbits+1 entry counts (uint64),
+    then (key, position) records sorted by key.
+    Entries are first split by their first byte into temporary bucket files,
+    so only 1/256 of the table is held in memory at a time.
+    Parameters
+    ----------
+    filename : string
+        Truncated binary file (e.g. output of hextobin())
+    truncvalue : int
+        Truncation parameter (in hexes). Read from the header of binary table files.
+    dirbits : int
+        Size of prefix directory in bits. Picked from the table size if None.
+    Example: buildTruncIndex("part1.bin",16)
+    Returns
+    -------
+    None
+    """
+    truncoffset = 2
+    with open(str(filename), 'rb') as filehandle:
+        header = readTableHeader(filehandle)
+    datastart = 0
+    if header != None:
+        truncvalue, truncoffset, datastart = header['truncvalue'], header['truncoffset'], header['start']
+    width = (truncvalue+1)//2
+    reclen = width + IDXPOS.size
+    count = (os.path.getsize(filename)-datastart)//width
+    if count >= 2**32:
+        raise ValueError("Too many entries for index: " + str(count))
+    if dirbits == None:
+        dirbits = max(8,min(24,count.bit_length()-4))
+    dirbits = min(dirbits,8*width,24)
+    start = time.time()
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as tmpdir:
+        buckets = [open(os.path.join(tmpdir,str(b)),'wb') for b in range(256)]
+        with open(str(filename), 'rb') as filehandle:
+            filehandle.seek(datastart)
+            pos = 0
+            while True:
+                chunk = filehandle.read(width*2**16)
+                if not chunk:
+                    break
+                for k in range(0,len(chunk)-width+1,width):
+                    pos+=1
+                    key = chunk[k:k+width]
+                    buckets[key[0]].write(key + IDXPOS.pack(pos))
+        for bucket in buckets:
+            bucket.close()
+        directory = [0]*(2**dirbits+1)
+        with open(str(filename)+".idx", 'wb') as outfile:
+            outfile.write(IDXHEADER.pack(IDXMAGIC,truncvalue,truncoffset,dirbits,count))
+            outfile.write(bytes(8*len(directory))) #reserve space for directory
+            for b in range(256):
+                with open(os.path.join(tmpdir,str(b)),'rb') as bucket:
+                    data = bucket.read()
+                records = [data[k:k+reclen] for k in range(0,len(data),reclen)]
+                records.sort() #big endian positions keep equal keys in table order
+                for rec in records:
+                    directory[_idxbucket(rec,dirbits)+1]+=1
+                outfile.write(b''.join(records))
+            for j in range(1,len(directory)):
+                directory[j]+=directory[j-1]
+            outfile.seek(IDXHEADER.size)
+            outfile.write(struct.pack('>'+str(len(directory))+'Q',*directory))
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+
+def lookupelemtrunclidx(filename,elem,truncvalue):
+    '''Returns position of elem in binary file using its index (see buildTruncIndex())'''
+    with open(str(filename)+".idx", 'rb') as filehandle:
+        _, truncvalue, truncoffset, dirbits, _ = IDXHEADER.unpack(filehandle.read(IDXHEADER.size))
+        key = truncKey(elem,truncvalue,truncoffset)
+        width = len(key)
+        reclen = width + IDXPOS.size
+        bucket = _idxbucket(key,dirbits)
+        filehandle.seek(IDXHEADER.size + 8*bucket)
+        lo, hi = struct.unpack('>2Q',filehandle.read(16))
+        filehandle.seek(IDXHEADER.size + 8*(2**dirbits+1) + lo*reclen)
+        records = filehandle.read((hi-lo)*reclen)
+    lo, hi = 0, len(records)//reclen
+    while lo < hi: #leftmost match, as the linear scan returns the first one
+        mid = (lo+hi)//2
+        if records[mid*reclen:mid*reclen+width] < key:
+            lo = mid+1
+        else:
+            hi = mid
+    if records[lo*reclen:lo*reclen+width] == key:
+        return IDXPOS.unpack_from(records,lo*reclen+width)[0]
+    return None
+
+def buildTruncIndexparts(numfiles=None,truncvalue=None):
+    """
+    Run buildTruncIndex() across truncated file parts (see findParts()),
+    the first numfiles of them if set
+    """
+    for filename in findParts(".bin")[:numfiles]:
+        print("Indexing "+filename)
+        buildTruncIndex(filename,truncvalue)
+
+def lookupelemtrunclfilepartsbin(elem,truncvalue,index=False,table=None):
+    """
+    Returns position of elem in truncated file parts (see findParts()).
+    If index is set, probes the part indices built by buildTruncIndexparts()
+    instead of scanning each part.
+    If table (a TruncTable) is given, its mapped parts are used instead of
+    reopening the files.
     Example: 
     lookupelemtrunclfilepartsbin(str(455*PP.g),16)
     """
-    result = None
-    for i in range(1,17):
-        print(i)
-        if result == None:
-            result = lookupelemtrunclbin("part"+str(i)+".bin",elem,truncvalue)
+    if table != None:
+        return table.find(elem)
+    for shard in tableShards(findParts(".bin"),truncvalue):
+        if index:
+            result = lookupelemtrunclidx(shard['filename'],elem,truncvalue)
+        else:
+            print(shard['filename'])
+            result = lookupelemtrunclbin(shard['filename'],elem,truncvalue)
+        if result != None:
+            return result + shard['first'] - 1
+
+BLOOMMAGIC = b'DLOGBLM1'
+BLOOMHEADER = struct.Struct('>8sQB') #magic, number of bits, number of hashes
+
+class BloomFilter:
+    """
+    Bloom filter over table keys, answering "surely missing" for most keys not in the table
+    ...
+    Attributes
+    ----------
+    nbits : int
+        Size of filter in bits
+    k : int
+        Number of hash functions
+    bits : bytearray
+        Filter bits
+    """
+    def __init__(self, capacity, fprate=0.01, nbits=None, k=None):
+
+        """
+        Parameters
+        ----------
+        capacity : int
+            Expected number of keys
+        fprate : float
+            Target false positive rate
+        nbits, k : int
+            Explicit size and number of hashes (computed from capacity and fprate if None)
+        """
+        if nbits == None:
+            nbits = max(8, int(-capacity*math.log(fprate)/math.log(2)**2))
+        if k == None:
+            k = max(1, round(nbits/max(capacity,1)*math.log(2)))
+        self.nbits = nbits
+        self.k = k
+        self.bits = bytearray((nbits+7)//8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8],'little')
+        h2 = int.from_bytes(digest[8:],'little') | 1
+        return [(h1 + i*h2) % self.nbits for i in range(self.k)]
+
+    def add(self, key):
+        """Adds key (bytes) to the filter"""
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        for pos in self._positions(key):
+            if not (self.bits[pos >> 3] >> (pos & 7)) & 1:
+                return False
+        return True
+
+    def save(self, filename):
+        """Saves filter to file"""
+        with open(filename, 'wb') as filehandle:
+            filehandle.write(BLOOMHEADER.pack(BLOOMMAGIC, self.nbits, self.k))
+            filehandle.write(self.bits)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads filter saved by save()"""
+        with open(filename, 'rb') as filehandle:
+            magic, nbits, k = BLOOMHEADER.unpack(filehandle.read(BLOOMHEADER.size))
+            if magic != BLOOMMAGIC:
+                raise ValueError(str(filename) + " is not a Bloom filter file")
+            bloom = cls(0, nbits=nbits, k=k)
+            filehandle.readinto(bloom.bits)
+        return bloom
+
+def buildBloom(table,fprate=0.01,filename=None):
+    """Builds a BloomFilter over all keys of a TruncTable
+    Parameters
+    ----------
+    table : TruncTable
+        Table to be filtered
+    fprate : float
+        Target false positive rate
+    filename : string
+        Saves the filter to this file if given
+    Example: buildBloom(TruncTable(16),0.001,"parts.bloom")
+    Returns
+    -------
+    BloomFilter
+    """
+    bloom = BloomFilter(len(table), fprate)
+    width = table.width
+    for i, mm in enumerate(table.parts):
+        if mm == None:
+            continue
+        end = len(mm) - (len(mm)-table.starts[i]) % width
+        for pos in range(table.starts[i], end, width*2**16):
+            chunk = mm[pos:min(pos+width*2**16,end)]
+            for k in range(0,len(chunk),width):
+                bloom.add(chunk[k:k+width])
+    if filename != None:
+        bloom.save(filename)
+    return bloom
+
+def findParts(suffix=".bin",prefix="part"):
+    """
+    Returns the file parts in the current directory in order (part1, part2, ...)
+    Example: findParts("") for text parts, findParts(".bin") for truncated binary parts
+    """
+    parts = []
+    for filename in os.listdir():
+        num = filename[len(prefix):len(filename)-len(suffix)]
+        if filename.startswith(prefix) and filename.endswith(suffix) and num.isdigit():
+            parts.append((int(num),filename))
+    return [filename for _, filename in sorted(parts)]
+
+def tableShards(filenames,truncvalue=None):
+    """
+    Returns where each truncated binary file part sits in the table
+    Parameters
+    ----------
+    filenames : list
+        Truncated binary file parts (raw or with header), in table order
+    truncvalue : int
+        Truncation parameter (in hexes) of raw parts
+    Returns
+    -------
+    list
+        dict per part: filename, first (value of first entry), count,
+        start (byte offset of first entry), truncvalue, truncoffset, width
+    Raises
+    ------
+    ValueError
+        If a part was built for another curve than CURVENUMBER, or parts
+        disagree on truncvalue, truncoffset or width
+    """
+    shards = []
+    nextfirst = 1
+    for filename in filenames:
+        with open(str(filename), 'rb') as filehandle:
+            header = readTableHeader(filehandle)
+        if header != None:
+            if header['curve'] != CURVENUMBER:
+                raise ValueError(str(filename) + " was built for curve " + str(header['curve'])
+                                 + ", not " + str(CURVENUMBER))
+            shard = {'first':header['first'], 'count':header['count'], 'start':header['start'],
+                     'truncvalue':header['truncvalue'], 'truncoffset':header['truncoffset'],
+                     'width':header['width']}
+        else:
+            shard = {'first':nextfirst, 'count':os.path.getsize(filename)//((truncvalue+1)//2), 'start':0,
+                     'truncvalue':truncvalue, 'truncoffset':2, 'width':(truncvalue+1)//2}
+        if shards and any(shard[field] != shards[0][field] for field in ('truncvalue','truncoffset','width')):
+            raise ValueError(str(filename) + " is truncated differently from " + str(shards[0]['filename']))
+        shard['filename'] = filename
+        nextfirst = shard['first'] + shard['count']
+        shards.append(shard)
+    return shards
+
+class TruncTable:
+    """
+    Truncated binary table parts, memory-mapped once and kept open across queries
+    ...
+    Attributes
+    ----------
+    truncvalue : int
+        Truncation parameter (in hexes)
+    width : int
+        Size of each entry in bytes
+    truncoffset : int
+        First hex kept by truncation (see truncKey())
+    filenames : list
+        Truncated binary file parts, in table order
+    parts : list
+        mmap of each part (None for empty parts)
+    indices : list
+        mmap of each part's index from buildTruncIndex() (None if not built)
+    starts : list
+        Byte offset of the first entry in each part (after its header, if any)
+    offsets : list
+        Value of each part's first entry minus one
+    fds : list
+        File descriptor of each unindexed part, read with os.pread() by scanpart()
+        (opened only when probing concurrently)
+    pool : ThreadPoolExecutor
+        Probes parts concurrently (None for serial probing)
+    bloom : BloomFilter
+        Checked before any part is probed (None to always probe)
+    """
+    def __init__(self, truncvalue, filenames=None, threads=None, bloom=None):
+
+        """
+        Parameters
+        ----------
+        truncvalue : int
+            Truncation parameter (in hexes). Read from the headers of binary table files.
+        filenames : list
+            Truncated binary file parts. Defaults to all partN.bin files (see findParts())
+        threads : int
+            Number of threads probing parts concurrently (serial if None)
+        bloom : BloomFilter or string
+            Filter from buildBloom(), or file it was saved to
+        Example:
+        t = TruncTable(16)
+        t.find(str(455*PP.g))
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if filenames == None:
+            filenames = findParts(".bin")
+        shards = tableShards(filenames, truncvalue)
+        self.truncvalue = shards[0]['truncvalue'] if shards else truncvalue
+        self.truncoffset = shards[0]['truncoffset'] if shards else 2
+        self.width = (self.truncvalue+1)//2
+        self.filenames = [shard['filename'] for shard in shards]
+        self.starts = [shard['start'] for shard in shards]
+        self.offsets = [shard['first']-1 for shard in shards]
+        self.total = sum(shard['count'] for shard in shards)
+        self.parts = []
+        self.indices = []
+        for filename in self.filenames:
+            self.parts.append(self._map(filename))
+            self.indices.append(self._map(filename+".idx") if path.exists(filename+".idx") else None)
+        self.fds = [os.open(str(filename), os.O_RDONLY) if threads and mm != None and idx == None else None
+                    for filename, mm, idx in zip(self.filenames, self.parts, self.indices)]
+        self.pool = ThreadPoolExecutor(threads) if threads else None
+        self.bloom = BloomFilter.load(bloom) if isinstance(bloom, str) else bloom
+
+    @staticmethod
+    def _map(filename):
+        with open(str(filename), 'rb') as filehandle:
+            if os.fstat(filehandle.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Unmaps all parts and indices and closes their files"""
+        if self.pool != None:
+            self.pool.shutdown()
+            self.pool = None
+        for mm in self.parts + self.indices:
+            if mm != None:
+                mm.close()
+        for fd in self.fds:
+            if fd != None:
+                os.close(fd)
+        self.parts = []
+        self.indices = []
+        self.fds = []
+
+    def entry(self, num):
+        """Returns entry at (1-based) position num as a memoryview, without copying"""
+        i = bisect.bisect_right(self.offsets, num-1) - 1
+        k = self.starts[i] + (num-1-self.offsets[i])*self.width
+        return memoryview(self.parts[i])[k:k+self.width]
+
+    def findpart(self, i, key):
+        """Returns (1-based) position of key in part i, None if missing"""
+        mm = self.parts[i]
+        if mm == None:
+            return None
+        idx = self.indices[i]
+        if idx != None:
+            _, _, _, dirbits, _ = IDXHEADER.unpack_from(idx, 0)
+            width = self.width
+            reclen = width + IDXPOS.size
+            lo, hi = struct.unpack_from('>2Q', idx, IDXHEADER.size + 8*_idxbucket(key,dirbits))
+            base = IDXHEADER.size + 8*(2**dirbits+1)
+            while lo < hi:
+                mid = (lo+hi)//2
+                if idx[base+mid*reclen:base+mid*reclen+width] < key:
+                    lo = mid+1
+                else:
+                    hi = mid
+            if idx[base+lo*reclen:base+lo*reclen+width] == key:
+                return IDXPOS.unpack_from(idx, base+lo*reclen+width)[0]
+            return None
+        start = self.starts[i]
+        k = mm.find(key, start)
+        while k != -1 and (k-start) % self.width:
+            k = mm.find(key, k+1)
+        METRICS.inc('bytes_scanned', (len(mm) if k == -1 else k) - start)
+        if k == -1:
+            return None
+        return (k-start)//self.width + 1
+
+    def scanpart(self, i, key):
+        """Returns (1-based) position of key in unindexed part i, reading it in
+        large blocks so other threads run while waiting for the disk"""
+        if self.fds[i] == None:
+            return self.findpart(i, key)
+        step = self.width*2**20
+        pos = self.starts[i]
+        while True:
+            chunk = os.pread(self.fds[i], step, pos)
+            METRICS.inc('bytes_scanned', len(chunk))
+            if len(chunk) < self.width:
+                return None
+            k = chunk.find(key)
+            while k != -1 and k % self.width:
+                k = chunk.find(key, k+1)
+            if k != -1:
+                return (pos-self.starts[i]+k)//self.width + 1
+            pos += step
+
+    def find(self, elem):
+        """Returns (1-based) position of hex element elem in the table, None if missing"""
+        METRICS.inc('probes')
+        key = truncKey(elem,self.truncvalue,self.truncoffset)
+        if self.bloom != None and key not in self.bloom:
+            return None
+        #parts hold consecutive discrete logs, whose encodings are spread uniformly
+        #over all keys, so every non-empty part has to be probed
+        parts = [i for i, mm in enumerate(self.parts) if mm != None]
+        if self.pool != None and len(parts) > 1:
+            futures = [self.pool.submit(self.findpart if self.indices[i] != None else self.scanpart, i, key)
+                       for i in parts]
+            for i, future in zip(parts, futures):
+                result = future.result()
+                if result != None:
+                    for other in futures:
+                        other.cancel()
+                    return result + self.offsets[i]
+            return None
+        for i in parts:
+            result = self.findpart(i, key)
             if result != None:
-                return result + ((i-1)*2**28)
+                return result + self.offsets[i]
+        return None
+
+    def findmany(self, elems):
+        """Returns (1-based) positions of many hex elements, None for missing ones.
+        Parts with an index are probed per element, the others are swept once
+        for all elements together."""
+        METRICS.inc('probes', len(elems))
+        results = [None]*len(elems)
+        pending = {}
+        for j, elem in enumerate(elems):
+            key = truncKey(elem,self.truncvalue,self.truncoffset)
+            if self.bloom == None or key in self.bloom:
+                pending.setdefault(key,[]).append(j)
+        for i, mm in enumerate(self.parts):
+            if not pending or mm == None:
+                continue
+            if self.indices[i] != None:
+                hits = {}
+                for key in pending:
+                    res = self.findpart(i, key)
+                    if res != None:
+                        hits[key] = res
+            else:
+                hits = {}
+                width = self.width
+                step = width*2**16
+                datastart = self.starts[i]
+                end = len(mm) - (len(mm)-datastart) % width
+                for start in range(datastart, end, step):
+                    chunk = mm[start:min(start+step,end)]
+                    METRICS.inc('bytes_scanned', len(chunk))
+                    for k in range(0, len(chunk), width):
+                        key = chunk[k:k+width]
+                        if key in pending and key not in hits:
+                            hits[key] = (start-datastart+k)//width + 1
+            for key, res in hits.items():
+                for j in pending.pop(key):
+                    results[j] = res + self.offsets[i]
+        return results
 
-def babygiantsteptruncbin(gx,truncvalue,giantstepsize):
+def babygiantsteptruncbin(gx,truncvalue,giantstepsize,index=False,table=None,fallbackbits=None):
     """
     Returns position of decrypted value from gx using truncation and Shanks.
+    Set index to probe the part indices (see buildTruncIndexparts()).
+    Pass a TruncTable as table to reuse mapped parts across calls.
+    Set fallbackbits to search values up to fallbackbits bits past the giant steps
+    with kangaroo() when Shanks fails.
     Example: babygiantsteptruncbin(Bn.from_decimal("4294968296")*PP.g,16,32)
     """
+    gx0 = gx
     i = 1
     gstp = Bn.from_decimal(str(2**giantstepsize))*PP.g
     res = None
     start = time.time()
     while i <= 2**giantstepsize and res == None:
         print(str(i)+"/"+str(2**giantstepsize),end='\r',flush=True)
-        res = lookupelemtrunclfilepartsbin(str(gx),truncvalue)
+        res = lookupelemtrunclfilepartsbin(str(gx),truncvalue,index,table)
         gx = gx - gstp
         i+=1
+    METRICS.inc('giant_steps', i-1)
+    METRICS.addtime('decrypt', time.time() - start)
     if res == None:
+        if fallbackbits != None:
+            if table != None:
+                entries = len(table)
+            else:
+                entries = sum(shard['count'] for shard in tableShards(findParts(".bin"), truncvalue))
+            res = kangaroo(gx0,*_fallbackRange(entries,2**giantstepsize,2**giantstepsize,fallbackbits))
         print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
-        return None
+        return res
     else:
         print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
         return res+(i-2)*(2**giantstepsize)
 
+def babygiantsteptruncbinbatch(gxs,truncvalue,giantstepsize,table=None):
+    """
+    Returns decrypted values of many gxs using truncation and Shanks.
+    Each giant step answers all pending values with one pass over the table
+    (see TruncTable.findmany()).
+    Example: babygiantsteptruncbinbatch([455*PP.g,Bn.from_decimal("4294968296")*PP.g],16,32)
+    """
+    opened = table == None
+    if opened:
+        table = TruncTable(truncvalue)
+    results = [None]*len(gxs)
+    pending = dict(enumerate(gxs))
+    gstp = Bn.from_decimal(str(2**giantstepsize))*PP.g
+    i = 1
+    start = time.time()
+    while i <= 2**giantstepsize and pending:
+        print(str(i)+"/"+str(2**giantstepsize),end='\r',flush=True)
+        keys = list(pending)
+        found = table.findmany([str(pending[j]) for j in keys])
+        for j, res in zip(keys, found):
+            if res != None:
+                results[j] = res+(i-1)*(2**giantstepsize)
+                del pending[j]
+            else:
+                pending[j] = pending[j] - gstp
+        i+=1
+    if opened:
+        table.close()
+    print("Total time: " + str(round((time.time() - start) ,3)) + str(" sec"))
+    return results
+
+def _kangarooWorker(curve,gxbin,lo,N,jumpbits,dpbits,seed,maxsteps,quit,results):
+    """Runs one tame and one wild kangaroo, reporting distinguished points (see kangaroo())"""
+    error = None
+    try:
+        group, g = curveGroup(curve)
+        rand = random.Random(seed)
+        W = EcPt.from_binary(gxbin, group) - Bn.from_decimal(str(lo))*g #log in [0,N)
+        jumps = [Bn.from_decimal(str(2**j))*g for j in range(jumpbits)]
+        dpmask = 2**dpbits - 1
+        def restart(kind):
+            if kind == 'T':
+                r = rand.randrange(N//2, N)
+                return [Bn.from_decimal(str(r))*g, r]
+            r = rand.randrange(0, max(1,N//2))
+            return [W + Bn.from_decimal(str(r))*g, r]
+        herd = {'T':restart('T'), 'W':restart('W')}
+        steps = 0
+        while steps < maxsteps and not quit.is_set():
+            for kind, roo in herd.items():
+                h = int.from_bytes(roo[0].export()[-8:],'big')
+                if (h >> 8) & dpmask == 0:
+                    results.put((kind, roo[0].export(), roo[1]))
+                    herd[kind] = restart(kind)
+                    continue
+                j = h % jumpbits
+                roo[0] = roo[0] + jumps[j]
+                roo[1] += 2**j
+            steps+=1
+    except Exception as e:
+        error = repr(e)
+    finally:
+        #always report, the parent waits for one final message per worker
+        results.put(('E', error))
+
+def _fallbackRange(entries,step,steps,fallbackbits):
+    """Returns range [lo,hi) left for kangaroo() after steps giant steps of size step
+       against a table of discrete logs 1 to entries. Shanks covers 1 to
+       (steps-1)*step + entries without gaps only if entries >= step, otherwise
+       everything past the table is searched. hi is fallbackbits bits past the
+       largest value Shanks can find."""
+    top = (steps-1)*step + entries
+    lo = top + 1 if entries >= step else entries + 1
+    return lo, max(lo+1, top*2**fallbackbits + 1)
+
+def kangaroo(gx,lo,hi,cores=mp.cpu_count(),curve=CURVENUMBER,dpbits=None,maxsteps=None):
+    """
+    Pollard kangaroo (lambda) search for the discrete log of gx in [lo,hi).
+    Each core runs a tame kangaroo starting at a known log and a wild one starting
+    from gx. Walks restart after each distinguished point they report, and the
+    log follows when a tame and a wild walk report the same point.
+    Parameters
+    ----------
+    gx : EcPt
+        Value to decrypt
+    lo, hi : int
+        Range of the discrete log
+    cores : int
+        Number of cores to be used
+    curve : int
+        Curve number
+    dpbits : int
+        Distinguished points have dpbits zero bits (picked from the range if None)
+    maxsteps : int
+        Steps per core before giving up (picked from the range if None)
+    Example: kangaroo(Bn.from_decimal("1099511627776")*PP.g,2**40,2**41)
+    Returns
+    -------
+    int
+        Discrete log, None if not found
+    """
+    if hi <= lo:
+        raise ValueError("kangaroo: empty range [" + str(lo) + "," + str(hi) + ")")
+    N = hi-lo
+    root = max(1, math.isqrt(N))
+    jumpbits = 1
+    while 2**(jumpbits+1)/(jumpbits+1) <= 2*cores*root/4: #mean jump ~ kangaroos*sqrt(N)/4
+        jumpbits+=1
+    if dpbits == None:
+        dpbits = max(0, (root//(16*cores)).bit_length()-1)
+    if maxsteps == None:
+        maxsteps = 16*root//cores + 2**(dpbits+4)
+    group, g = curveGroup(curve)
+    quit = mp.Event()
+    results = mp.Queue()
+    procs = [mp.Process(target=_kangarooWorker, args=(curve, gx.export(), lo, N, jumpbits, dpbits,
+                        random.randrange(2**64), maxsteps, quit, results)) for _ in range(cores)]
+    for p in procs:
+        p.start()
+    seen = {}
+    found = None
+    errors = []
+    running = len(procs)
+    def receive():
+        """Next message from the workers, None once they all exited without reporting"""
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if all(not p.is_alive() for p in procs) and results.empty():
+                    errors.append("worker exited without a result (exit codes "
+                                  + str([p.exitcode for p in procs]) + ")")
+                    return None
+    while running and found == None:
+        msg = receive()
+        if msg == None:
+            running = 0
+            break
+        if msg[0] == 'E':
+            running-=1
+            if msg[1] != None:
+                errors.append(msg[1])
+            continue
+        kind, point, log = msg
+        if point in seen and seen[point][0] != kind:
+            tame = log if kind == 'T' else seen[point][1]
+            wild = log if kind == 'W' else seen[point][1]
+            x = lo + tame - wild
+            if Bn.from_decimal(str(x))*g == gx:
+                found = x
+        seen[point] = (kind, log)
+    quit.set()
+    while running: #drain so that workers can exit
+        msg = receive()
+        if msg == None:
+            break
+        if msg[0] == 'E':
+            running-=1
+    for p in procs:
+        p.join()
+    if found == None and errors:
+        raise RuntimeError("kangaroo: " + "; ".join(errors))
+    return found
+
+class DLogSolver:
+    """
+    Shanks decryption against a baby-step table, set up once and reused across calls
+    ...
+    Attributes
+    ----------
+    group : EcGroup
+        Elliptic curve as defined in petlib library
+    g : EcPt
+        Generator g
+    table : list, LookupDict, TruncTable or PrefixTrie
+        Baby-step table, whose entries are 1*g, 2*g, ... (TruncTable and PrefixTrie
+        entries carry their own discrete logs)
+    step : int
+        Giant step size (2^giantstepsize)
+    steps : int
+        Number of giant steps tried before giving up
+    gstp, neggstp : EcPt
+        Giant step point and its negation
+    window : int
+        Giant steps computed and encoded together (None for one at a time)
+    blockstp : EcPt
+        -window*gstp, moving to the next block of giant steps
+    fallbackbits : int
+        Values up to fallbackbits bits past the giant steps are searched with kangaroo()
+    """
+    def __init__(self, table, giantstepsize, curve=CURVENUMBER, steps=None, window=None, fallbackbits=None):
+
+        """
+        Parameters
+        ----------
+        table : list, LookupDict, TruncTable or PrefixTrie
+            Baby-step table (e.g. from readLookFromFileB(), TruncTable(16), buildVarTrie(16))
+        giantstepsize : int
+            Giant step is 2^giantstepsize, which should not exceed the table size
+        curve : int
+            Curve number of the table
+        steps : int
+            Number of giant steps (2^giantstepsize if None)
+        window : int
+            If set, candidates gx - j*gstp for j in a block of window steps are
+            computed in Jacobian coordinates and normalized together (see encodedSteps())
+        fallbackbits : int
+            If set, values Shanks misses are searched with kangaroo() up to
+            fallbackbits bits past the giant steps
+        Example:
+        s = DLogSolver(TruncTable(16),32)
+        s.solve(Bn.from_decimal("4294968296")*PP.g)
+        """
+        self.curve = curve
+        self.group, self.g = curveGroup(curve)
+        self.table = table
+        self.fallbackbits = fallbackbits
+        self.step = 2**giantstepsize
+        self.steps = self.step if steps == None else steps
+        self.gstp = Bn.from_decimal(str(self.step))*self.g
+        self.neggstp = -self.gstp
+        self.window = window
+        if window != None:
+            self.blockstp = Bn.from_decimal(str(window))*self.neggstp
+        if isinstance(table, TruncTable):
+            self._find = table.find
+            self._findmany = table.findmany
+        elif isinstance(table, PrefixTrie):
+            self._find = table.lookup
+            self._findmany = None
+        else:
+            self._find = self._findlist
+            self._findmany = None
+
+    def _findlist(self, elem):
+        if isinstance(self.table, LookupDict):
+            idxs = self.table.indices(elem)
+            return tuple(idx + 1 for idx in idxs) if idxs else None
+        try:
+            return self.table.index(elem) + 1
+        except ValueError:
+            return None
+
+    def _verify(self, gx, res, base):
+        """Returns base plus the table value res (or one of the tuple of values of colliding
+        LookupDict keys) that is the discrete log of gx, None if none is.
+        Truncated tables (TruncTable, PrefixTrie, LookupDict with keywidth) also
+        match values they do not hold, so every hit is checked."""
+        for value in (res if isinstance(res, tuple) else (res,)):
+            if Bn.from_decimal(str(value + base))*self.g == gx:
+                return value + base
+        return None
+
+    def _candidates(self, gx, i):
+        """Returns encodings of gx - j*gstp for the block of giant steps starting at i"""
+        return list(encodedSteps(gx, self.neggstp, min(self.window, self.steps-i), self.window))
+
+    def fallback(self, gx):
+        """Searches the range past the giant steps with kangaroo(), None if disabled or not found"""
+        if self.fallbackbits == None:
+            return None
+        lo, hi = _fallbackRange(len(self.table), self.step, self.steps, self.fallbackbits)
+        return kangaroo(gx, lo, hi, curve=self.curve)
+
+    def solve(self, gx):
+        """Returns discrete log of gx (EcPt), None if not found"""
+        METRICS.inc('decryptions')
+        res = self._solve(gx)
+        if res == None:
+            return self.fallback(gx)
+        return res
+
+    def _solve(self, gx):
+        gx0 = gx
+        if self.window != None:
+            for i in range(0, self.steps, self.window):
+                for j, elem in enumerate(self._candidates(gx, i)):
+                    res = self._find(elem)
+                    if res != None:
+                        res = self._verify(gx0, res, (i+j)*self.step)
+                        if res != None:
+                            METRICS.inc('giant_steps', i+j+1)
+                            return res
+                gx = gx + self.blockstp
+            METRICS.inc('giant_steps', self.steps)
+            return None
+        for i in range(self.steps):
+            res = self._find(str(gx))
+            if res != None:
+                res = self._verify(gx0, res, i*self.step)
+                if res != None:
+                    METRICS.inc('giant_steps', i+1)
+                    return res
+            gx = gx + self.neggstp
+        METRICS.inc('giant_steps', self.steps)
+        return None
+
+    def solveMany(self, gxs):
+        """Returns discrete logs of many gxs together (see babygiantsteptruncbinbatch()),
+        None for values not found"""
+        METRICS.inc('decryptions', len(gxs))
+        results = self._solveMany(gxs)
+        if self.fallbackbits != None:
+            for j, res in enumerate(results):
+                if res == None:
+                    results[j] = self.fallback(gxs[j])
+        return results
+
+    def _solveMany(self, gxs):
+        results = [None]*len(gxs)
+        pending = dict(enumerate(gxs))
+        if self.window != None:
+            for i in range(0, self.steps, self.window):
+                if not pending:
+                    break
+                keys = list(pending)
+                blocks = [self._candidates(pending[j], i) for j in keys]
+                elems = [elem for block in blocks for elem in block]
+                METRICS.inc('giant_steps', len(elems))
+                if self._findmany != None:
+                    found = self._findmany(elems)
+                else:
+                    found = [self._find(elem) for elem in elems]
+                for n, j in enumerate(keys):
+                    block = found[n*len(blocks[0]):(n+1)*len(blocks[0])]
+                    for k, res in enumerate(block):
+                        if res != None:
+                            res = self._verify(gxs[j], res, (i+k)*self.step)
+                        if res != None:
+                            results[j] = res
+                            del pending[j]
+                            break
+                    else:
+                        pending[j] = pending[j] + self.blockstp
+            return results
+        for i in range(self.steps):
+            if not pending:
+                break
+            keys = list(pending)
+            elems = [str(pending[j]) for j in keys]
+            METRICS.inc('giant_steps', len(elems))
+            if self._findmany != None:
+                found = self._findmany(elems)
+            else:
+                found = [self._find(elem) for elem in elems]
+            for j, res in zip(keys, found):
+                if res != None:
+                    res = self._verify(gxs[j], res, i*self.step)
+                if res != None:
+                    results[j] = res
+                    del pending[j]
+                else:
+                    pending[j] = pending[j] + self.neggstp
+        return results
+
 class Logger(object):
-    def __init__(self):
+    """
+    Copies everything printed to logfile.log, which is opened on the first write
+    """
+    def __init__(self, filename="logfile.log"):
         self.terminal = sys.stdout
-        self.log = open("logfile.log", "a")
+        self.filename = filename
+        self.log = None
 
     def write(self, message):
         self.terminal.write(message)
+        if self.log == None:
+            self.log = open(self.filename, "a")
         self.log.write(message)  
 
     def flush(self):
-        pass    
+        self.terminal.flush()
+        if self.log != None:
+            self.log.flush()
 
-sys.stdout = Logger()
+def enableLogfile(filename="logfile.log"):
+    """
+    Copies everything printed from now on to filename (see Logger).
+    Nothing is logged unless this is called, importing the module leaves sys.stdout alone.
+    Example: enableLogfile(); lookup2File(16)
+    Returns
+    -------
+    Logger
+        The installed logger (the existing one if already enabled)
+    """
+    if not isinstance(sys.stdout, Logger):
+        sys.stdout = Logger(filename)
+    return sys.stdout
+
+def disableLogfile():
+    """Stops copying printed output to the log file and closes it"""
+    if isinstance(sys.stdout, Logger):
+        logger = sys.stdout
+        sys.stdout = logger.terminal
+        if logger.log != None:
+            logger.log.close()
 
 def varTruncNew(size,startTrunc,endTrunc):
     """
@@ -971,33 +3144,430 @@ def varTruncNew(size,startTrunc,endTrunc):
     print(gammalist)
     print(Counter(gammalist))
 
+def _varTruncInit(B1,startTrunc,endTrunc):
+    """Keeps table B1 and its prefix sets in each worker of varTruncNewPar()"""
+    global _B1, _B1prefixes, _truncRange
+    _B1 = B1
+    _truncRange = (startTrunc,endTrunc)
+    _B1prefixes = {T: set(elem[:T] for elem in B1) for T in range(endTrunc,startTrunc+1)}
+
+def _varTruncPart(args):
+    """Returns collision depth of each B1 entry against one part (worker of varTruncNewPar())"""
+    i, skip = args
+    startTrunc, endTrunc = _truncRange
+    hits = {T: set() for T in range(endTrunc,startTrunc+1)}
+    with open("part"+str(i), 'r') as A1:
+        for num, line in enumerate(A1):
+            if num < skip or line[:endTrunc] not in _B1prefixes[endTrunc]:
+                continue
+            T = startTrunc
+            while line[:T] not in _B1prefixes[T]:
+                T-=1
+            for t in range(endTrunc,T+1):
+                hits[t].add(line[:t])
+    depths = bytearray(len(_B1))
+    for j, elem in enumerate(_B1):
+        for T in range(startTrunc,endTrunc-1,-1):
+            if elem[:T] in hits[T]:
+                depths[j] = T
+                break
+    return i, bytes(depths)
+
+def varTruncNewPar(size,startTrunc,endTrunc,numfiles=16,cores=mp.cpu_count(),checkpoint="gamma"):
+    """
+    First part of Algorithm 1, with one streaming pass per part and parts spread over cores.
+    Each part is read once. Lines sharing at least endTrunc hexes with some B1 entry
+    record all their prefixes that are also prefixes of B1 entries,
+    from which the collision depth of every B1 entry follows.
+    Gamma is saved after every part (checkpoint.npy, completed parts in checkpoint.done),
+    so running again resumes.
+    Parameters
+    ----------
+    size : int
+        32 for 2**32, 16 for 2**16
+    startTrunc, endTrunc : int
+        when to start and stop truncating (in hexes)
+    numfiles : int
+        number of splitted files
+    cores : int
+        Number of cores to be used
+    checkpoint : string
+        Name of gamma and progress files
+    Example: varTruncNewPar(32,12,6)
+    Returns
+    -------
+    gamma
+        numpy uint8 array of truncation values
+    """
+    import numpy as np
+    start = time.time()
+    print("**Begin**")
+    with open("part1", 'r') as A1:
+        B1 = [A1.readline()[:-1] for _ in range(0,2**(size-12))]
+    gamma = np.zeros(len(B1), dtype=np.uint8)
+    done = set()
+    if path.exists(checkpoint+".npy") and path.exists(checkpoint+".done"):
+        saved = np.load(checkpoint+".npy")
+        if saved.shape == gamma.shape:
+            gamma = saved
+            with open(checkpoint+".done") as f:
+                done = set(int(line) for line in f if line.strip())
+            print("Resuming, completed parts: " + str(sorted(done)))
+    tasks = [(i, 2**(size-12) if i == 1 else 0) for i in range(1,numfiles+1) if i not in done]
+    with mp.Pool(cores, initializer=_varTruncInit, initargs=(B1,startTrunc,endTrunc)) as pool:
+        for i, depths in pool.imap_unordered(_varTruncPart, tasks):
+            np.maximum(gamma, np.frombuffer(depths, dtype=np.uint8), out=gamma)
+            np.save(checkpoint+".tmp.npy", gamma)
+            os.replace(checkpoint+".tmp.npy", checkpoint+".npy")
+            with open(checkpoint+".done", "a") as f:
+                f.write(str(i)+"\n")
+            print("Completed Table " +str(i))
+            print("Time elapsed: " + str(   round(time.time() - start,2)    ) + " sec"  )
+    print(Counter(gamma.tolist()))
+    return gamma
+
 def file2list(fname):
     with open(fname) as f:
         x = [line.rstrip() for line in f]
     return ast.literal_eval(x[0])
 
-def varTruncNewB(size,startTrunc,endTrunc):
+def loadGamma(fname="gamma.npy"):
+    """Loads gamma list saved as .npy (varTruncNewPar()) or as a Python literal (gamma.txt)
+    Returns
+    -------
+    gamma
+        numpy uint8 array of truncation values
+    """
+    import numpy as np
+    if fname.endswith(".npy"):
+        return np.load(fname)
+    return np.array(file2list(fname), dtype=np.uint8)
+
+def varTruncNewB(size,startTrunc,endTrunc,gammafile="gamma.npy",outfile="gammaB.npy"):
     """
     Second part of Algorithm 1 (self check in table B)
+    Sorts table B once: the longest prefix an entry shares with any other entry of B
+    is the longest it shares with one of its sorted neighbours.
+    Reads gamma from gammafile (gamma.txt if gammafile is missing) and saves the result to outfile.
+    Example: varTruncNewB(32,12,6)
+    Returns
+    -------
+    gamma
+        numpy uint8 array of truncation values
     """
-    T =startTrunc #Truncation factor with no existing collisions (in hexes)
-    B = file2list('gamma.txt')
-    print(Counter(B))
-    num = 0
-    Btlist = []
+    import numpy as np
+    if not path.exists(gammafile) and path.exists("gamma.txt"):
+        gammafile = "gamma.txt"
+    B = loadGamma(gammafile)
+    print(Counter(B.tolist()))
     with open("part1") as myfile:
-        Btlist = [next(myfile) for x in range(2**(size-12))]
-    while (T>=endTrunc):
-        print(T)
-        with open("part1", 'r') as A1:
-            Bt = dict()
-            for elem in Btlist:
-                if elem[:T] in Bt:
-                    Bt[elem[:T]] = True
-                else:
-                    Bt[elem[:T]] = False
-        for j, elem in enumerate(Btlist):
-            if Bt[elem[:T]] == True and B[j] <T:
-                B[j] = T                
-        T = T-1 #increase truncation
-    print(Counter(B))
+        Btlist = [next(myfile)[:-1] for x in range(2**(size-12))]
+    order = sorted(range(len(Btlist)), key=Btlist.__getitem__)
+    depth = np.zeros(len(Btlist), dtype=np.uint8) #longest common prefix with another entry of B
+    for k in range(1,len(order)):
+        a, b = order[k-1], order[k]
+        common = min(_lcp(Btlist[a],Btlist[b]),startTrunc)
+        depth[a] = max(depth[a],common)
+        depth[b] = max(depth[b],common)
+    depth[depth < endTrunc] = 0
+    np.maximum(B, depth, out=B)
+    np.save(outfile, B)
+    print(Counter(B.tolist()))
+    return B
+
+def _timed(results,name,count,fn,*args):
+    """Runs fn(*args) with stdout silenced, records time and throughput under name"""
+    start = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        out = fn(*args)
+    elapsed = time.time() - start
+    results[name] = {'seconds':round(elapsed,6), 'items':count,
+                     'itemspersec':round(count/elapsed,3) if elapsed > 0 else None}
+    return out
+
+def _latencies(results,name,fn,args):
+    """Calls fn on each tuple of args, records latency percentiles under name"""
+    lat = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for arg in args:
+            start = time.time()
+            fn(*arg)
+            lat.append(time.time() - start)
+    lat.sort()
+    pct = lambda q: round(lat[min(len(lat)-1, int(q*len(lat)))]*1000,3)
+    results[name] = {'probes':len(lat), 'persec':round(len(lat)/sum(lat),3) if sum(lat) > 0 else None,
+                     'p50_ms':pct(0.5), 'p90_ms':pct(0.9), 'p99_ms':pct(0.99), 'max_ms':round(lat[-1]*1000,3)}
+
+def benchmark(sizes=(16,20,24),truncvalue=16,probes=20,scanprobes=3,seed=1,outfile=None):
+    """
+    Builds synthetic tables on CURVENUMBER and times generation, truncation,
+    duplicate checking and decryption end to end.
+    Runs in a temporary directory. Scan based lookups (lookupelemtrunclbin(),
+    babygiantstep(), babygiantsteptruncbin()) get scanprobes probes, the others probes.
+    Parameters
+    ----------
+    sizes : tuple
+        Table sizes as exponents (2^size-1 entries)
+    truncvalue : int
+        Truncation parameter (in hexes) of binary tables
+    probes, scanprobes : int
+        Number of decryptions timed
+    seed : int
+        Seed for the values decrypted
+    outfile : string
+        Writes the JSON report to this file if given
+    Example: benchmark((16,20),outfile="bench.json")
+    Returns
+    -------
+    dict
+        Report (also printed as JSON)
+    """
+    rand = random.Random(seed)
+    report = {'curve':CURVENUMBER, 'python':sys.version.split()[0], 'cores':mp.cpu_count(), 'sizes':{}}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for rng in sizes:
+                n = 2**rng-1
+                results = {}
+                _timed(results,'lookup2File',n,lookup2File,rng)
+                _timed(results,'lookup2FileBatch',n,lookup2FileBatch,2**rng)
+                _timed(results,'lookup2FileParallel',n,lookup2FileParallel,2**rng)
+                _timed(results,'lookup2FileBin',n,lookup2FileBin,2**rng,1,truncvalue)
+                tablefile = str(CURVENUMBER)+'-'+str(rng)+'bits.txt'
+                f = _timed(results,'readLookFromFile',n,readLookFromFile,rng)
+                _timed(results,'truncate',n,truncate,f)
+                _timed(results,'truncateNp',n,lambda: truncateNp(readMatrixFromFile(tablefile)))
+                _timed(results,'truncVar',n,truncVar,rng)
+                _timed(results,'checkDupsFile',n,checkDupsFile,tablefile)
+                _timed(results,'hex2bin',n,hex2bin,tablefile,truncvalue,'left','part1.bin')
+                _timed(results,'checkDupsExternal',n,checkDupsExternal,['part1.bin'],truncvalue,2**28,'dups.txt')
+                _timed(results,'buildTruncIndex',n,buildTruncIndex,'part1.bin',truncvalue)
+                step = 2**rng
+                scanvals = [rand.randrange(1,4*step) for _ in range(scanprobes)]
+                vals = [rand.randrange(1,step*step) for _ in range(probes)]
+                _latencies(results,'lookupelemtrunclbin',lookupelemtrunclbin,
+                           [('part1.bin',str(rand.randrange(1,step)*PP.g),truncvalue) for _ in range(scanprobes)])
+                _latencies(results,'babygiantstep',babygiantstep,[(f,x*PP.g,step) for x in scanvals])
+                os.rename('part1.bin.idx','part1.bin.idx.off') #scan, as without index
+                _latencies(results,'babygiantsteptruncbin',babygiantsteptruncbin,
+                           [(x*PP.g,truncvalue,rng) for x in scanvals])
+                os.rename('part1.bin.idx.off','part1.bin.idx')
+                with TruncTable(truncvalue,['part1.bin']) as table:
+                    _latencies(results,'babygiantsteptruncbin_table',babygiantsteptruncbin,
+                               [(Bn.from_decimal(str(x))*PP.g,truncvalue,rng,False,table) for x in vals])
+                    solver = DLogSolver(table,rng,window=256)
+                    _latencies(results,'DLogSolver',solver.solve,[(Bn.from_decimal(str(x))*PP.g,) for x in vals])
+                    gxs = [Bn.from_decimal(str(x))*PP.g for x in vals]
+                    _timed(results,'DLogSolver.solveMany',len(gxs),solver.solveMany,gxs)
+                report['sizes'][str(rng)] = results
+                for filename in os.listdir():
+                    os.remove(filename)
+        finally:
+            os.chdir(cwd)
+    #ru_maxrss only ever grows, so peaks are reported for the whole run, not per phase
+    report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report['peak_rss_children_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if outfile != None:
+        with open(outfile, 'w') as filehandle:
+            json.dump(report, filehandle, indent=1)
+    print(json.dumps(report))
+    return report
+
+class DLogService:
+    """
+    Local decryption service sharing one warm DLogSolver between clients
+    Clients send compressed hex encodings of points, one per line, and get back
+    "<point> <discrete log>" lines ("<point> None" if not found, "<point> error"
+    if the line is not a point or solving it failed) as soon as each one is solved.
+    Requests arriving within window seconds of each other are solved together
+    with solveMany().
+    ...
+    Attributes
+    ----------
+    solver : DLogSolver
+        Solver with its table already loaded
+    window : float
+        Seconds to wait for more requests before solving a batch
+    maxbatch : int
+        Largest number of points solved together
+    """
+    def __init__(self, solver, window=0.005, maxbatch=1024, executor=None):
+
+        """
+        Parameters
+        ----------
+        solver : DLogSolver
+            Solver with its table already loaded
+        window : float
+            Seconds to wait for more requests before solving a batch
+        maxbatch : int
+            Largest number of points solved together
+        executor : concurrent.futures.Executor
+            Where batches run (a single thread if None, so batches never overlap)
+        Example:
+        s = DLogService(DLogSolver(TruncTable(16),16))
+        asyncio.run(s.serve(port=7140))
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        self.solver = solver
+        self.window = window
+        self.maxbatch = maxbatch
+        self.executor = ThreadPoolExecutor(1) if executor == None else executor
+        self.queue = None
+        self.batcher = None
+
+    async def decrypt(self, gx):
+        """Returns discrete log of gx (EcPt), None if not found"""
+        import asyncio
+        if self.batcher == None:
+            self.queue = asyncio.Queue()
+            self.batcher = asyncio.get_running_loop().create_task(self._batches())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((gx, future))
+        return await future
+
+    async def _batches(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            await asyncio.sleep(self.window)
+            while len(batch) < self.maxbatch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            METRICS.inc('service_batches')
+            try:
+                results = await loop.run_in_executor(self.executor, self.solver.solveMany,
+                                                     [gx for gx, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), res in zip(batch, results):
+                if not future.done():
+                    future.set_result(res)
+
+    async def _answer(self, line, writer):
+        try:
+            gx = EcPt.from_binary(binascii.unhexlify(line), self.solver.group)
+        except Exception:
+            writer.write((line + " error\n").encode())
+            return
+        try:
+            res = await self.decrypt(gx)
+        except Exception:
+            #the batch failed, the client still gets one answer per request
+            writer.write((line + " error\n").encode())
+            return
+        writer.write((line + " " + str(res) + "\n").encode())
+
+    async def handle(self, reader, writer):
+        """Serves one client connection until it closes"""
+        import asyncio
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line:
+                    task = asyncio.get_running_loop().create_task(self._answer(line, writer))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    if writer.transport.get_write_buffer_size() > 2**20:
+                        await writer.drain()
+            if pending:
+                await asyncio.gather(*pending)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=7140, unixpath=None):
+        """Accepts clients on localhost TCP port (or Unix socket unixpath) until cancelled"""
+        import asyncio
+        if unixpath != None:
+            server = await asyncio.start_unix_server(self.handle, unixpath)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        print("Serving on " + (unixpath if unixpath != None else host + ":" + str(port)))
+        async with server:
+            await server.serve_forever()
+
+def runService(table, giantstepsize, host='127.0.0.1', port=7140, unixpath=None, window=0.005, **kwargs):
+    """
+    Loads a solver and serves decryptions (see DLogService) until interrupted
+    Parameters
+    ----------
+    table : TruncTable, list or dict
+        Lookup table (as accepted by DLogSolver)
+    giantstepsize: int
+        giant step parameter (2^giantstepsize steps of size 2^giantstepsize)
+    host, port : string, int
+        Localhost TCP address to listen on
+    unixpath : string
+        Unix socket to listen on instead of TCP
+    window : float
+        Seconds to wait for more requests before solving a batch
+    kwargs :
+        Passed to DLogSolver (curve, steps, window, fallbackbits)
+    Example: runService(TruncTable(16),16)
+    Returns
+    -------
+    None
+    """
+    import asyncio
+    service = DLogService(DLogSolver(table, giantstepsize, **kwargs), window)
+    try:
+        asyncio.run(service.serve(host, port, unixpath))
+    except KeyboardInterrupt:
+        pass
+    service.executor.shutdown()
+    return None
+
+def decryptRemote(points, host='127.0.0.1', port=7140, unixpath=None):
+    """
+    Decrypts points with a running DLogService
+    Parameters
+    ----------
+    points : list
+        EcPt values or their compressed hex encodings
+    host, port : string, int
+        Address of the service
+    unixpath : string
+        Unix socket of the service instead of TCP
+    Example: decryptRemote([255*PP.g, 1000*PP.g])
+    Returns
+    -------
+    list
+        Discrete logs in the order of points (None if not found)
+    """
+    import socket
+    if unixpath != None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unixpath)
+    else:
+        sock = socket.create_connection((host, port))
+    lines = [str(pt) for pt in points]
+    with sock, sock.makefile('rwb') as stream:
+        stream.write(''.join(line + '\n' for line in lines).encode())
+        stream.flush()
+        sock.shutdown(socket.SHUT_WR)
+        answers = {}
+        for _ in range(len(lines)):
+            answer = stream.readline().decode().split()
+            if len(answer) != 2:
+                raise ConnectionError("Service closed the connection before answering")
+            answers[answer[0]] = answer[1]
+    results = []
+    for line in lines:
+        if answers[line] == "error":
+            raise ValueError("Not a point, or decryption failed: " + line)
+        results.append(None if answers[line] == "None" else int(answers[line]))
+    return results